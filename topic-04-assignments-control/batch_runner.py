@@ -0,0 +1,256 @@
+"""
+batch_runner.py -- run script files, parsing each through the disk cache
+
+    python batch_runner.py script.txt ...              # cache in TRIVIAL_CACHE_DIR
+    python batch_runner.py --cache DIR script.txt ...
+    python batch_runner.py --no-cache script.txt ...
+    python batch_runner.py --workers 8 script.txt ...  # in 8 processes
+    python batch_runner.py                             # run the tests
+
+Each script runs in a fresh environment. A script that fails is reported
+on stderr and the rest still run. The cache hit and miss counts are
+reported on stderr at the end. With --workers the scripts run the same
+way, with the same cache options, in worker processes; what each script
+prints is collected and written in the order the scripts were given.
+
+Many small programs can be run in a pool of worker processes:
+
+    for index, value, environment, output, error in run_jobs(jobs, workers=8):
+        ...
+
+jobs is a list of (source, environment) pairs. Results come back as each
+chunk of jobs finishes, not in the order of jobs; index says which job a
+result is for. Workers live for the whole run and keep the programs they
+have compiled, so a source that comes up again is not parsed again.
+"""
+
+import concurrent.futures
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+from evaluator import evaluate
+from cache import Cache, LineCache, format_statistics, parse_source
+import compiler
+import output
+
+
+def run_script(path, cache):
+    """
+    (value, environment) of the script at path
+    """
+    with open(path) as file:
+        source = file.read()
+    if cache is None:
+        ast = parse_source(source)
+    else:
+        ast = cache.parse(source)
+    environment = {}
+    value, _ = evaluate(ast, environment)
+    return value, environment
+
+
+def run_scripts(paths, cache):
+    """
+    run every script, returning the paths of those that failed
+    """
+    failed = []
+    for path in paths:
+        try:
+            run_script(path, cache)
+        except Exception as e:
+            print(f"{path}: {type(e).__name__}: {e}", file=sys.stderr)
+            failed.append(path)
+    return failed
+
+
+# compiled programs by source, in each worker process
+programs = LineCache(1024, lambda source: compiler.compile_program(parse_source(source)))
+
+
+def run_job(source, environment):
+    """
+    (value, environment, output, error) of running source, with what it
+    printed in output and error None, or a description of the exception
+    """
+    printed = output.ListSink()
+    value, error = None, None
+    try:
+        program = programs.parse(source)
+        with output.redirect(printed):
+            value, _ = program(environment)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return value, environment, printed.getvalue(), error
+
+
+def run_chunk(start, jobs):
+    """
+    the results of jobs, numbered from start, run in a worker
+    """
+    return [
+        (start + index,) + run_job(source, environment)
+        for index, (source, environment) in enumerate(jobs)
+    ]
+
+
+def run_jobs(jobs, workers=None, chunk_size=64):
+    """
+    yield (index, value, environment, output, error) for every job, as
+    the jobs finish
+    """
+    jobs = list(jobs)
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        # one submission per chunk, so small jobs are not dominated by
+        # the cost of sending each one to a worker
+        futures = [
+            executor.submit(run_chunk, start, jobs[start : start + chunk_size])
+            for start in range(0, len(jobs), chunk_size)
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            yield from future.result()
+
+
+def run_captured(path, cache_directory):
+    """
+    (output, error, cache statistics) of run_script() in a worker, with
+    error None or a description of the exception
+    """
+    cache = None if cache_directory is None else Cache(cache_directory)
+    printed = output.ListSink()
+    error = None
+    try:
+        with output.redirect(printed):
+            run_script(path, cache)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return printed.getvalue(), error, cache and cache.statistics
+
+
+def run_scripts_in_pool(paths, cache, workers):
+    """
+    run_scripts() in a pool of workers: the output of each script is
+    written in the order of paths, and the workers' cache counts are
+    added to cache.statistics
+    """
+    directory = None if cache is None else cache.directory
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        # map() hands back the results in the order of paths
+        results = executor.map(run_captured, paths, [directory] * len(paths))
+        for path, (printed, error, statistics) in zip(paths, results):
+            sys.stdout.write(printed)
+            if error:
+                print(f"{path}: {error}", file=sys.stderr)
+                failed.append(path)
+            for key, count in (statistics or {}).items():
+                cache.statistics[key] += count
+    return failed
+
+
+def main(arguments):
+    cache = Cache()
+    workers = None
+    paths = []
+    arguments = list(arguments)
+    while arguments:
+        argument = arguments.pop(0)
+        if argument == "--cache":
+            cache = Cache(arguments.pop(0))
+        elif argument == "--no-cache":
+            cache = None
+        elif argument == "--workers":
+            workers = int(arguments.pop(0))
+        else:
+            paths.append(argument)
+    if workers:
+        failed = run_scripts_in_pool(paths, cache, workers)
+    else:
+        failed = run_scripts(paths, cache)
+    if cache is not None:
+        print("parse cache:", format_statistics(cache.statistics), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def test_run_scripts():
+    print("test run scripts")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for name, code in [
+            ("count.txt", "{x=3; y=0; while (x>0) {x=x-1;y=y+1}; print(x, y)}"),
+            ("broken.txt", "{x=1; y=x/0}"),
+            ("value.txt", "{x=4; x*2}"),
+        ]:
+            paths.append(os.path.join(directory, name))
+            with open(paths[-1], "w") as file:
+                file.write(code)
+        cache = Cache(os.path.join(directory, "cache"))
+        for _ in range(2):
+            printed = io.StringIO()
+            errors = io.StringIO()
+            with contextlib.redirect_stdout(printed), contextlib.redirect_stderr(errors):
+                failed = run_scripts(paths, cache)
+            assert printed.getvalue() == "0 3 \n"
+            assert failed == [paths[1]]
+            assert "ZeroDivisionError" in errors.getvalue()
+        assert cache.statistics["misses"] == 3
+        assert cache.statistics["hits"] == 3
+        assert run_script(paths[2], None) == (8, {"x": 4})
+
+
+def test_run_scripts_in_pool():
+    print("test run scripts in pool")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index in range(6):
+            paths.append(os.path.join(directory, f"script{index}.txt"))
+            with open(paths[-1], "w") as file:
+                # the first script is the slowest, so it finishes last
+                file.write(f"{{i={20000 if index == 0 else 1}; while(i>0) i=i-1; print({index})}}")
+        with open(paths[3], "w") as file:
+            file.write("{print(3); 1/0}")
+        expected = "0 \n1 \n2 \n3 \n4 \n5 \n"
+        for cache in [Cache(os.path.join(directory, "cache")), None]:
+            for _ in range(2):
+                printed = io.StringIO()
+                errors = io.StringIO()
+                with contextlib.redirect_stdout(printed), contextlib.redirect_stderr(errors):
+                    failed = run_scripts_in_pool(paths, cache, workers=2)
+                assert printed.getvalue() == expected
+                assert failed == [paths[3]]
+                assert errors.getvalue() == f"{paths[3]}: ZeroDivisionError: division by zero\n"
+        # counted in the workers, added up here
+        cache = Cache(os.path.join(directory, "cache"))
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            run_scripts_in_pool(paths, cache, workers=2)
+        assert cache.statistics["hits"] == 6 and cache.statistics["misses"] == 0
+
+
+def test_run_jobs():
+    print("test run jobs")
+    jobs = [
+        ("{y=0; while (x>0) {x=x-1;y=y+1}; print(x, y)}", {"x": index % 7})
+        for index in range(150)
+    ]
+    jobs.append(("x/0", {"x": 1}))
+    jobs.append(("{z=x*2; z+1}", {"x": 4}))
+    results = sorted(run_jobs(jobs, workers=2, chunk_size=16))
+    assert [result[0] for result in results] == list(range(len(jobs)))
+    for index, value, environment, output, error in results[:150]:
+        assert (value, error) == (None, None)
+        assert environment == {"x": 0, "y": index % 7}
+        assert output == f"0 {index % 7} \n"
+    assert results[150][4] == "ZeroDivisionError: division by zero"
+    assert results[151][1:] == (9, {"x": 4, "z": 8}, "", None)
+    assert list(run_jobs([])) == []
+
+
+if __name__ == "__main__":
+    if sys.argv[1:]:
+        sys.exit(main(sys.argv[1:]))
+    test_run_scripts()
+    test_run_scripts_in_pool()
+    test_run_jobs()
+    print("done.")
@@ -0,0 +1,631 @@
+# benchmark
+
+"""
+timing comparisons between the interpreter's alternative implementations
+
+    python benchmark.py               # run every benchmark
+    python benchmark.py tokenizer     # run the named benchmarks only
+"""
+
+import gc
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from tokenizer import tokenize, tokenize_single_pass, tokenize_compact, iter_tokens
+from tokenizer import tokenize_file
+from parser import parse
+import parser
+import cursor_parser
+import evaluator
+import dispatch_evaluator
+import compiler
+import bytecode
+import resolver
+import incremental
+import stack_parser
+import list_form
+import stack_evaluator
+import cache
+import batch_runner
+import output
+import instrument
+import sampler
+
+
+def generate_lines(statements):
+    """
+    a block of `statements` assignments, loops and prints, as generated code would look
+    """
+    yield "{"
+    for index in range(statements):
+        kind = index % 4
+        if kind == 0:
+            yield f"    x_{index} = ({index} + 2.5) * y / 4 - -{index};"
+        elif kind == 1:
+            yield f"    if (x_{index - 1} >= {index} && y != 0) z = z + 1 else z = z - 1;"
+        elif kind == 2:
+            yield f"    i = 0; while (i < 3) {{ i = i + 1; total = total + i }};"
+        else:
+            yield f"    print(x_{index - 3}, z, total);"
+    yield "}"
+
+
+def generate_program(statements):
+    return "\n".join(generate_lines(statements))
+
+
+def best_time(function, *arguments, repeat=3):
+    """
+    best wall time of `repeat` calls, with the garbage collector off as timeit does
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function(*arguments)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmark_tokenizer():
+    print("benchmark tokenizer: pattern table loop vs single pass master pattern")
+    for statements in [100, 1000, 10000]:
+        code = generate_program(statements)
+        token_count = len(tokenize_single_pass(code))
+        table = best_time(tokenize, code)
+        single = best_time(tokenize_single_pass, code)
+        print(
+            f"  {token_count:>8} tokens  "
+            f"table {table * 1000:9.2f} ms  "
+            f"single pass {single * 1000:9.2f} ms  "
+            f"speedup {table / single:5.2f}x"
+        )
+
+
+def benchmark_parser_scaling():
+    print("benchmark parser scaling: token slicing vs index cursor")
+    for token_target in [1000, 10000, 100000, 1000000]:
+        tokens = tokenize_single_pass(generate_program(token_target * 4 // 70))
+        cursor = best_time(cursor_parser.parse, tokens, repeat=1)
+        line = (
+            f"  {len(tokens):>8} tokens  "
+            f"cursor {cursor * 1000:9.2f} ms  "
+            f"{cursor * 1e9 / len(tokens):7.0f} ns/token"
+        )
+        if len(tokens) <= 20000:
+            slicing = best_time(parser.parse, tokens, repeat=1)
+            line += f"  slicing {slicing * 1000:9.2f} ms"
+        print(line)
+
+
+def count_calls(function, *arguments):
+    """
+    number of Python function calls made while function runs
+    """
+    calls = 0
+
+    def profile(frame, event, argument):
+        nonlocal calls
+        if event == "call":
+            calls += 1
+
+    sys.setprofile(profile)
+    try:
+        function(*arguments)
+    finally:
+        sys.setprofile(None)
+    return calls
+
+
+def benchmark_pratt():
+    print("benchmark pratt: one function per precedence level vs precedence climbing")
+    tokens = tokenize_single_pass(generate_program(10000))
+    pratt = cursor_parser.parse_expression
+    for name, parse_expression in [
+        ("levels", cursor_parser.parse_expression_by_levels),
+        ("pratt", pratt),
+    ]:
+        cursor_parser.parse_expression = parse_expression
+        try:
+            elapsed = best_time(cursor_parser.parse, tokens)
+            calls = count_calls(cursor_parser.parse, tokens)
+            primary_calls = count_calls(parse_expression, tokenize("1"), 0)
+        finally:
+            cursor_parser.parse_expression = pratt
+        print(
+            f"  {name:<8} {elapsed * 1000:9.2f} ms  "
+            f"{calls / len(tokens):5.2f} calls/token  "
+            f"{primary_calls} calls to parse \"1\""
+        )
+
+
+def benchmark_nesting():
+    print("benchmark nesting: recursive cursor parser vs explicit-stack parser")
+    tokens = tokenize_single_pass(generate_program(10000))
+    cursor = best_time(cursor_parser.parse, tokens)
+    stack = best_time(stack_parser.parse, tokens)
+    print(f"  generated code   cursor {cursor * 1000:9.2f} ms  stack {stack * 1000:9.2f} ms")
+    for depth in [100, 1000, 10000, 100000]:
+        for name, code in stack_parser.nested_programs(depth).items():
+            if name not in ["parentheses", "minus", "blocks", "mixed"]:
+                continue
+            tokens = tokenize_single_pass(code)
+            try:
+                cursor = f"{best_time(cursor_parser.parse, tokens, repeat=1) * 1000:9.2f} ms"
+            except RecursionError:
+                cursor = f"{'RecursionError':>12}"
+            stack = best_time(stack_parser.parse, tokens, repeat=1)
+            print(
+                f"  depth {depth:>6} {name:<11}  "
+                f"cursor {cursor}  stack {stack * 1000:9.2f} ms"
+            )
+
+
+def benchmark_list_form():
+    print("benchmark list form: linked blocks vs list blocks in evaluator.evaluate")
+    for statements in [200, 400, 5000, 50000]:
+        linked = cursor_parser.parse(tokenize_single_pass(list_form.long_block(statements)))
+        ast = list_form.to_list_form(linked)
+        try:
+            chained = f"{best_time(evaluator.evaluate, linked, {}) * 1000:9.2f} ms"
+        except RecursionError:
+            chained = f"{'RecursionError':>12}"
+        listed = best_time(evaluator.evaluate, ast, {})
+        print(
+            f"  {statements:>6} statements  "
+            f"linked {chained}  list {listed * 1000:9.2f} ms"
+        )
+
+
+arithmetic_program = """{
+    i = 0; x = 1;
+    while (i < 2000) {
+        x = (x + i * 3 - 2) / 2 * (y - -1) + y * y - i / 4;
+        i = i + 1
+    }
+}"""
+
+loop_program = """{
+    i = 0; total = 0;
+    while (i < 200) {
+        j = 0;
+        while (j < 20) { j = j + 1; total = total + 1 };
+        i = i + 1
+    }
+}"""
+
+
+def count_visits(module, ast, environment):
+    """
+    number of calls to module.evaluate while evaluating ast
+    """
+    original = module.evaluate
+    visits = 0
+
+    def counting_evaluate(ast, environment):
+        nonlocal visits
+        visits += 1
+        return original(ast, environment)
+
+    module.evaluate = counting_evaluate
+    try:
+        original(ast, environment)
+    finally:
+        module.evaluate = original
+    return visits + 1
+
+
+def benchmark_evaluator_dispatch():
+    print("benchmark evaluator: tag comparison chain vs dispatch table")
+    for name, code in [("arithmetic", arithmetic_program), ("loops", loop_program)]:
+        ast = parse(tokenize(code))
+        visits = count_visits(evaluator, ast, {"y": 2})
+        chain = best_time(evaluator.evaluate, ast, {"y": 2})
+        table = best_time(dispatch_evaluator.evaluate, ast, {"y": 2})
+        print(
+            f"  {name:<10} {visits:>8} visits  "
+            f"chain {visits / chain / 1e6:6.2f} M visits/s  "
+            f"table {visits / table / 1e6:6.2f} M visits/s  "
+            f"speedup {chain / table:5.2f}x"
+        )
+
+
+def benchmark_stack_evaluator():
+    print("benchmark stack evaluator: recursive evaluate vs explicit work stack")
+    for name, code in [("arithmetic", arithmetic_program), ("loops", loop_program)]:
+        ast = parse(tokenize(code))
+        recursive = best_time(evaluator.evaluate, ast, {"y": 2})
+        stack = best_time(stack_evaluator.evaluate, ast, {"y": 2})
+        print(
+            f"  {name:<10} recursive {recursive * 1000:9.2f} ms  "
+            f"stack {stack * 1000:9.2f} ms  "
+            f"ratio {stack / recursive:5.2f}x"
+        )
+    for depth in [1000, 100000]:
+        code = stack_parser.nested_programs(depth)["operators"]
+        ast = stack_parser.parse(tokenize_single_pass(code))
+        stack = best_time(stack_evaluator.evaluate, ast, {})
+        print(f"  {depth:>6} nested additions  stack {stack * 1000:9.2f} ms")
+
+
+def benchmark_compiler():
+    print("benchmark compiler: tree walking evaluate vs compiled closures")
+    for name, code in [("arithmetic", arithmetic_program), ("loops", loop_program)]:
+        ast = parse(tokenize(code))
+        program = compiler.compile_program(ast)
+        walking = best_time(evaluator.evaluate, ast, {"y": 2})
+        compiled = best_time(program, {"y": 2})
+        print(
+            f"  {name:<10} "
+            f"evaluate {walking * 1000:9.2f} ms  "
+            f"compiled {compiled * 1000:9.2f} ms  "
+            f"speedup {walking / compiled:5.2f}x"
+        )
+
+
+def benchmark_bytecode():
+    print("benchmark bytecode: tree walking evaluate vs bytecode vm")
+    for name, code in [("arithmetic", arithmetic_program), ("loops", loop_program)]:
+        ast = parse(tokenize(code))
+        compiled = bytecode.compile_program(ast)
+        walking = best_time(evaluator.evaluate, ast, {"y": 2})
+        vm = best_time(bytecode.run, compiled, {"y": 2})
+        print(
+            f"  {name:<10} {len(compiled['instructions']) // 2:>4} instructions  "
+            f"evaluate {walking * 1000:9.2f} ms  "
+            f"vm {vm * 1000:9.2f} ms  "
+            f"speedup {walking / vm:5.2f}x"
+        )
+
+
+def benchmark_resolver():
+    print("benchmark resolver: $parent chain walks vs resolved frame addresses")
+    code = "{i = 0; while (i < 2000) { s = a * b + c - d; i = i + 1 }}"
+    for depth in [1, 10, 100]:
+        environment = {"a": 1, "b": 2, "c": 3, "d": 4}
+        for _ in range(depth - 1):
+            environment = {"$parent": environment}
+        ast = parse(tokenize(code))
+        walking = best_time(evaluator.evaluate, ast, dict(environment))
+        frames = resolver.frames_from_environment(environment)
+        resolver.resolve(ast, frames)
+        resolved = best_time(resolver.evaluate, ast, frames)
+        print(
+            f"  depth {depth:>4}  "
+            f"chain walk {walking * 1000:9.2f} ms  "
+            f"resolved {resolved * 1000:9.2f} ms  "
+            f"speedup {walking / resolved:5.2f}x"
+        )
+
+
+guard_program = """{
+    i = 0; n = 3000; hits = 0;
+    while (i < n) {
+        if (i > n && (i * i * i - i * i + i / 3 * 2 - i * 7) / (i + 1) > 0) hits = hits + 1;
+        if (i < n || (i * i * i - i * i + i / 3 * 2 - i * 7) / (i + 1) > 0) hits = hits + 1;
+        i = i + 1
+    }
+}"""
+
+
+def benchmark_short_circuit():
+    print("benchmark short circuit: guards evaluating both operands vs short-circuit")
+    ast = parse(tokenize(guard_program))
+    handlers = dispatch_evaluator.handlers
+    short_circuit = handlers["&&"], handlers["||"]
+    handlers["&&"] = dispatch_evaluator.binary(lambda left, right: int(left and right))
+    handlers["||"] = dispatch_evaluator.binary(lambda left, right: int(left or right))
+    try:
+        eager = best_time(dispatch_evaluator.evaluate, ast, {})
+    finally:
+        handlers["&&"], handlers["||"] = short_circuit
+    lazy = best_time(dispatch_evaluator.evaluate, ast, {})
+    print(
+        f"  dispatch   both operands {eager * 1000:9.2f} ms  "
+        f"short-circuit {lazy * 1000:9.2f} ms  "
+        f"speedup {eager / lazy:5.2f}x"
+    )
+    program = compiler.compile_program(ast)
+    code = bytecode.compile_program(ast)
+    for name, function, arguments in [
+        ("evaluate", evaluator.evaluate, (ast, {})),
+        ("compiled", program, ({},)),
+        ("vm", bytecode.run, (code, {})),
+    ]:
+        print(f"  {name:<10} short-circuit {best_time(function, *arguments) * 1000:9.2f} ms")
+
+
+def traced_memory(function, *arguments):
+    """
+    bytes still allocated by the result of function, as seen by tracemalloc
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function(*arguments)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def benchmark_token_memory():
+    print("benchmark token memory: token dictionaries vs compact Token objects")
+    code = generate_program(25000)
+    tokens = tokenize_single_pass(code)
+    print(f"  {len(code) / 1e6:.2f} MB of source, {len(tokens)} tokens")
+    for name, function in [("dict", tokenize_single_pass), ("compact", tokenize_compact)]:
+        size = traced_memory(function, code)
+        elapsed = best_time(cursor_parser.parse, function(code), repeat=1)
+        print(
+            f"  {name:<8} tokens {size / 1e6:7.1f} MB  "
+            f"{size / len(tokens):6.1f} bytes/token  "
+            f"cursor parse {elapsed * 1000:8.1f} ms"
+        )
+
+
+def peak_memory(function, *arguments):
+    """
+    peak bytes allocated while function runs, as seen by tracemalloc
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(*arguments)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def benchmark_streaming():
+    print("benchmark streaming: whole-string tokenize vs iter_tokens over chunks")
+
+    def count_streamed(statements):
+        count = 0
+        chunks = (line + "\n" for line in generate_lines(statements))
+        for _ in iter_tokens(chunks):
+            count += 1
+        return count
+
+    def count_whole(statements):
+        return len(tokenize_single_pass(generate_program(statements)))
+
+    for statements in [2500, 10000, 40000]:
+        whole = peak_memory(count_whole, statements)
+        streamed = peak_memory(count_streamed, statements)
+        print(
+            f"  {statements:>6} statements  "
+            f"whole string peak {whole / 1e6:8.1f} MB  "
+            f"streamed peak {streamed / 1e6:8.3f} MB"
+        )
+
+
+def benchmark_mmap():
+    print("benchmark mmap: read and decode the file vs tokenize an mmap of it")
+
+    def read_and_tokenize(path):
+        with open(path) as file:
+            return tokenize_compact(file.read())
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.txt")
+        with open(path, "w") as file:
+            for line in generate_lines(25000):
+                file.write(line + "\n")
+        print(f"  {os.path.getsize(path) / 1e6:.2f} MB of source")
+        for name, function in [("read", read_and_tokenize), ("mmap", tokenize_file)]:
+            peak = peak_memory(function, path)
+            elapsed = best_time(function, path, repeat=1)
+            print(f"  {name:<6} peak {peak / 1e6:7.1f} MB  time {elapsed * 1000:8.1f} ms")
+
+
+def benchmark_incremental():
+    print("benchmark incremental: full tokenize + parse vs Document.edit per keystroke")
+    for statements in [1000, 10000]:
+        code = generate_program(statements)
+        document = incremental.Document(code)
+        offset = code.index(f"x_{statements // 2} = (") + len(f"x_{statements // 2} = (")
+
+        def full():
+            source = document.source
+            cursor_parser.parse(tokenize_single_pass(source[:offset] + "7" + source[offset:]))
+
+        def keystrokes():
+            # type a digit and delete it again, so the source stays the same
+            document.edit(offset, 0, "7")
+            document.edit(offset, 1, "")
+
+        whole = best_time(full)
+        edit = best_time(keystrokes) / 2
+        print(
+            f"  {statements:>6} statements  "
+            f"full {whole * 1000:9.2f} ms  "
+            f"edit {edit * 1000:9.3f} ms  "
+            f"reparsed {document.statistics['reparsed']} of {len(document.tokens)} tokens  "
+            f"shifted {document.statistics['shifted']} of "
+            f"{len(document.positioned_nodes)} nodes"
+        )
+
+
+def benchmark_cache():
+    print("benchmark cache: tokenize + stack_parser vs loading the marshalled AST from disk")
+    with tempfile.TemporaryDirectory() as directory:
+        for statements in [100, 1000]:
+            code = generate_program(statements)
+            parse_cache = cache.Cache(directory)
+            parse_cache.parse(code)
+            parsed = best_time(cache.parse_source, code)
+            loaded = best_time(parse_cache.parse, code)
+            print(
+                f"  {statements:>6} statements  "
+                f"parse {parsed * 1000:9.2f} ms  "
+                f"cache hit {loaded * 1000:9.2f} ms  "
+                f"speedup {parsed / loaded:7.1f}x"
+            )
+
+
+def benchmark_vectorized():
+    print("benchmark vectorized: evaluate per binding vs numpy over columns")
+    # numpy is only needed for this benchmark
+    import numpy
+    import vectorized
+
+    ast = parse(tokenize("x*y+z/2 > 10 && x != y"))
+    generator = numpy.random.default_rng(0)
+    for rows in [1000, 100000]:
+        columns = {
+            "x": generator.integers(0, 100, rows),
+            "y": generator.integers(0, 100, rows),
+            "z": generator.uniform(0, 10, rows),
+        }
+        environments = [
+            {name: values[row].item() for name, values in columns.items()}
+            for row in range(rows)
+        ]
+        scalar = best_time(
+            lambda: [evaluator.evaluate(ast, environment) for environment in environments],
+            repeat=1,
+        )
+        batched = best_time(vectorized.evaluate, ast, columns)
+        print(
+            f"  {rows:>7} bindings  "
+            f"evaluate {scalar * 1000:9.2f} ms  "
+            f"vectorized {batched * 1000:9.2f} ms  "
+            f"speedup {scalar / batched:7.1f}x"
+        )
+
+
+def benchmark_process_pool():
+    print("benchmark process pool: jobs one after another vs a pool of workers")
+    sources = [
+        f"{{y=0; x={index % 50}; while (x>0) {{x=x-1;y=y+{index}}}; print(y)}}"
+        for index in range(100)
+    ]
+    jobs = [(sources[index % 100], {}) for index in range(20000)]
+    sequential = best_time(
+        lambda: [batch_runner.run_job(source, dict(environment)) for source, environment in jobs],
+        repeat=1,
+    )
+    print(f"  {len(jobs)} jobs  sequential {sequential * 1000:9.2f} ms")
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        pooled = best_time(lambda: list(batch_runner.run_jobs(jobs, workers)), repeat=1)
+        print(
+            f"  {workers:>3} workers  pool {pooled * 1000:9.2f} ms  "
+            f"speedup {sequential / pooled:5.2f}x"
+        )
+
+
+class CountingStream(io.RawIOBase):
+    """
+    a raw stream counting the writes that reach it, each a system call
+    for a real file
+    """
+
+    def __init__(self):
+        self.writes = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.writes = self.writes + 1
+        return len(data)
+
+
+def benchmark_output():
+    print("benchmark output: a write per printed value vs buffered sinks")
+    program = compiler.compile_program(
+        parse(tokenize("{x=0; while (x<20000) {print(x, x*2, x*3); x=x+1}}"))
+    )
+    for name, buffer_size in [("unbuffered", 0), ("buffered", 65536), ("null", None)]:
+        raw = CountingStream()
+        # line buffered, as stdout is on a terminal
+        stream = io.TextIOWrapper(raw, line_buffering=True)
+        if buffer_size is None:
+            sink = output.NullSink()
+        else:
+            sink = output.StreamSink(stream, buffer_size)
+
+        def run():
+            with output.redirect(sink):
+                program({})
+
+        elapsed = best_time(run, repeat=1)
+        print(f"  {name:<10} {raw.writes:>7} writes  {elapsed * 1000:9.2f} ms")
+
+
+def benchmark_instrument():
+    print("benchmark instrument: evaluate with and without per-tag counters")
+    for name, code in [("arithmetic", arithmetic_program), ("loops", loop_program)]:
+        ast = parse(tokenize(code))
+        plain = best_time(evaluator.evaluate, ast, {"y": 2})
+        instrument.enable()
+        try:
+            instrumented = best_time(evaluator.evaluate, ast, {"y": 2})
+        finally:
+            instrument.disable()
+        disabled = best_time(evaluator.evaluate, ast, {"y": 2})
+        print(
+            f"  {name:<10} plain {plain * 1000:9.2f} ms  "
+            f"instrumented {instrumented * 1000:9.2f} ms  "
+            f"disabled again {disabled * 1000:9.2f} ms"
+        )
+
+
+def benchmark_sampler():
+    print("benchmark sampler: evaluate with and without a sampling thread")
+    for name, code in [("arithmetic", arithmetic_program), ("loops", loop_program)]:
+        ast = parse(tokenize(code))
+        plain = best_time(evaluator.evaluate, ast, {"y": 2})
+        samples = sampler.Sampler(code)
+        with samples:
+            sampled = best_time(evaluator.evaluate, ast, {"y": 2})
+        print(
+            f"  {name:<10} plain {plain * 1000:9.2f} ms  "
+            f"sampled {sampled * 1000:9.2f} ms  "
+            f"overhead {sampled / plain - 1:6.1%}  {samples.samples:>5} samples"
+        )
+
+
+benchmarks = {
+    "tokenizer": benchmark_tokenizer,
+    "parser": benchmark_parser_scaling,
+    "pratt": benchmark_pratt,
+    "nesting": benchmark_nesting,
+    "list-form": benchmark_list_form,
+    "cache": benchmark_cache,
+    "dispatch": benchmark_evaluator_dispatch,
+    "stack-evaluator": benchmark_stack_evaluator,
+    "compiler": benchmark_compiler,
+    "bytecode": benchmark_bytecode,
+    "resolver": benchmark_resolver,
+    "short-circuit": benchmark_short_circuit,
+    "token-memory": benchmark_token_memory,
+    "streaming": benchmark_streaming,
+    "mmap": benchmark_mmap,
+    "incremental": benchmark_incremental,
+    "vectorized": benchmark_vectorized,
+    "process-pool": benchmark_process_pool,
+    "output": benchmark_output,
+    "instrument": benchmark_instrument,
+    "sampler": benchmark_sampler,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        benchmarks[name]()
+    print("done.")
@@ -0,0 +1,439 @@
+"""
+bytecode.py -- compile an AST to linear stack code and run it in a loop
+
+The instructions are (opcode, argument) pairs of integers in an array, with
+numbers in a constant pool and identifiers in a name pool. "if" and "while"
+become jumps, so running a program does not recurse in Python at all.
+
+    code = compile_program(parse(tokenize(string_of_code)))
+    value, returning = run(code, environment)
+    print(disassemble(code))
+"""
+
+from array import array
+import operator
+
+from tokenizer import tokenize
+from parser import parse
+import evaluator
+import output
+
+# opcodes, roughly in order of how often the dispatch loop sees them
+
+LOAD_NAME = 0
+LOAD_CONST = 1
+STORE_NAME = 2
+JUMP_IF_FALSE = 3
+JUMP = 4
+POP = 5
+JUMP_IF_FALSE_OR_POP = 6
+JUMP_IF_TRUE_OR_POP = 7
+TO_INT = 8
+NEGATE = 9
+NOT = 10
+PRINT = 11
+RETURN = 12
+ADD = 13
+SUBTRACT = 14
+MULTIPLY = 15
+DIVIDE = 16
+LESS = 17
+GREATER = 18
+LESS_EQUAL = 19
+GREATER_EQUAL = 20
+EQUAL = 21
+NOT_EQUAL = 22
+
+opcode_names = {
+    opcode: name
+    for name, opcode in list(globals().items())
+    if name.isupper() and type(opcode) is int
+}
+
+binary_opcodes = {
+    "+": ADD,
+    "-": SUBTRACT,
+    "*": MULTIPLY,
+    "/": DIVIDE,
+    "<": LESS,
+    ">": GREATER,
+    "<=": LESS_EQUAL,
+    ">=": GREATER_EQUAL,
+    "==": EQUAL,
+    "!=": NOT_EQUAL,
+}
+
+jump_opcodes = [JUMP, JUMP_IF_FALSE, JUMP_IF_FALSE_OR_POP, JUMP_IF_TRUE_OR_POP]
+
+# indexed by opcode - ADD
+binary_operations = [
+    operator.add,
+    operator.sub,
+    operator.mul,
+    operator.truediv,
+    lambda left, right: int(left < right),
+    lambda left, right: int(left > right),
+    lambda left, right: int(left <= right),
+    lambda left, right: int(left >= right),
+    lambda left, right: int(left == right),
+    lambda left, right: int(left != right),
+]
+
+
+def compile_program(ast):
+    """
+    code = {"instructions": array of (opcode, argument) pairs, "constants": [...], "names": [...]}
+    """
+    code = {"instructions": array("i"), "constants": [], "names": []}
+    # pool indexes by (type, repr), so 1 and 1.0, and 0.0 and -0.0, stay
+    # distinct constants
+    code["$pool"] = {}
+    compile_statement(ast, code, True)
+    emit(code, RETURN)
+    del code["$pool"]
+    return code
+
+
+def emit(code, opcode, argument=0):
+    """
+    append an instruction, returning its index so jumps can be patched later
+    """
+    instructions = code["instructions"]
+    instructions.append(opcode)
+    instructions.append(argument)
+    return len(instructions) - 2
+
+
+def patch(code, jump):
+    """
+    point the jump instruction at index jump to the next instruction emitted
+    """
+    code["instructions"][jump + 1] = len(code["instructions"])
+
+
+def pool_index(code, pool, value):
+    key = (pool, type(value), repr(value))
+    if key not in code["$pool"]:
+        code[pool].append(value)
+        code["$pool"][key] = len(code[pool]) - 1
+    return code["$pool"][key]
+
+
+def constant(code, value):
+    return pool_index(code, "constants", value)
+
+
+def name(code, identifier):
+    return pool_index(code, "names", identifier)
+
+
+def compile_statement(ast, code, keep_value):
+    """
+    emit code for a statement; when keep_value is set the code leaves the
+    statement's value (what evaluate would return) on the stack
+    """
+    tag = ast["tag"]
+    if tag == "block" and "statements" in ast:
+        statements = ast["statements"]
+        for statement in statements[:-1]:
+            compile_statement(statement, code, False)
+        if statements:
+            compile_statement(statements[-1], code, keep_value)
+        elif keep_value:
+            emit(code, LOAD_CONST, constant(code, None))
+    elif tag == "block":
+        while ast.get("next"):
+            compile_statement(ast["statement"], code, False)
+            ast = ast["next"]
+        compile_statement(ast["statement"], code, keep_value)
+    elif tag == "if":
+        compile_expression(ast["condition"], code)
+        skip_then = emit(code, JUMP_IF_FALSE)
+        compile_statement(ast["then"], code, keep_value)
+        if ast.get("else", None) or keep_value:
+            skip_else = emit(code, JUMP)
+            patch(code, skip_then)
+            if ast.get("else", None):
+                compile_statement(ast["else"], code, keep_value)
+            else:
+                emit(code, LOAD_CONST, constant(code, None))
+            patch(code, skip_else)
+        else:
+            patch(code, skip_then)
+    elif tag == "while":
+        start = len(code["instructions"])
+        compile_expression(ast["condition"], code)
+        skip_loop = emit(code, JUMP_IF_FALSE)
+        compile_statement(ast["do"], code, False)
+        emit(code, JUMP, start)
+        patch(code, skip_loop)
+        if keep_value:
+            emit(code, LOAD_CONST, constant(code, None))
+    elif tag == "print":
+        count = 0
+        argument = ast.get("arguments", None)
+        if type(argument) is list:
+            for argument in argument:
+                compile_expression(argument, code)
+                count = count + 1
+            argument = None
+        while argument:
+            compile_expression(argument, code)
+            count = count + 1
+            argument = argument.get("next", None)
+        emit(code, PRINT, count)
+        if keep_value:
+            emit(code, LOAD_CONST, constant(code, None))
+    elif tag == "=":
+        compile_assignment(ast, code)
+        if keep_value:
+            emit(code, LOAD_CONST, constant(code, None))
+    else:
+        compile_expression(ast, code)
+        if not keep_value:
+            emit(code, POP)
+
+
+def compile_assignment(ast, code):
+    assert (
+        ast["target"]["tag"] == "identifier"
+    ), f"ERROR: Expecting identifier in assignment statement."
+    assert ast["value"], f"ERROR: Expecting expression in assignment statement."
+    compile_expression(ast["value"], code)
+    emit(code, STORE_NAME, name(code, ast["target"]["value"]))
+
+
+def compile_expression(ast, code):
+    """
+    emit code that leaves the value of the expression on the stack
+    """
+    tag = ast["tag"]
+    if tag == "number":
+        assert type(ast["value"]) in [
+            float,
+            int,
+        ], f"unexpected ast numeric value {ast['value']} is a {type(ast['value'])}."
+        emit(code, LOAD_CONST, constant(code, ast["value"]))
+    elif tag == "identifier":
+        assert (
+            type(ast["value"]) is str
+        ), f"unexpected ast identifier value {ast['value']} is a {type(ast['value'])}."
+        emit(code, LOAD_NAME, name(code, ast["value"]))
+    elif tag in ["&&", "||"]:
+        # the left value decides: keep it and skip the right operand,
+        # or drop it and let the right operand's value stand
+        compile_expression(ast["left"], code)
+        if tag == "&&":
+            skip_right = emit(code, JUMP_IF_FALSE_OR_POP)
+        else:
+            skip_right = emit(code, JUMP_IF_TRUE_OR_POP)
+        compile_expression(ast["right"], code)
+        patch(code, skip_right)
+        emit(code, TO_INT)
+    elif tag in binary_opcodes:
+        compile_expression(ast["left"], code)
+        compile_expression(ast["right"], code)
+        emit(code, binary_opcodes[tag])
+    elif tag == "negate":
+        compile_expression(ast["value"], code)
+        emit(code, NEGATE)
+    elif tag == "not":
+        compile_expression(ast["value"], code)
+        emit(code, NOT)
+    elif tag in ["=", "if", "while", "print", "block"]:
+        compile_statement(ast, code, True)
+    else:
+        raise Exception(f"Unknown token in AST: {tag}")
+
+
+def run(code, environment):
+    """
+    run compiled code against an environment, returning (value, returning)
+    """
+    instructions = code["instructions"]
+    constants = code["constants"]
+    names = code["names"]
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    pc = 0
+    while True:
+        opcode = instructions[pc]
+        argument = instructions[pc + 1]
+        pc = pc + 2
+        if opcode >= ADD:
+            right = pop()
+            stack[-1] = binary_operations[opcode - ADD](stack[-1], right)
+        elif opcode == LOAD_NAME:
+            identifier = names[argument]
+            scope = environment
+            while scope:
+                if identifier in scope:
+                    push(scope[identifier])
+                    break
+                scope = scope.get("$parent", None)
+            else:
+                push(None)
+        elif opcode == LOAD_CONST:
+            push(constants[argument])
+        elif opcode == STORE_NAME:
+            environment[names[argument]] = pop()
+        elif opcode == JUMP_IF_FALSE:
+            if not pop():
+                pc = argument
+        elif opcode == JUMP:
+            pc = argument
+        elif opcode == POP:
+            pop()
+        elif opcode == JUMP_IF_FALSE_OR_POP:
+            if stack[-1]:
+                pop()
+            else:
+                pc = argument
+        elif opcode == JUMP_IF_TRUE_OR_POP:
+            if stack[-1]:
+                pc = argument
+            else:
+                pop()
+        elif opcode == TO_INT:
+            stack[-1] = int(stack[-1])
+        elif opcode == NEGATE:
+            stack[-1] = -stack[-1]
+        elif opcode == NOT:
+            stack[-1] = 0 if stack[-1] else 1
+        elif opcode == PRINT:
+            values = stack[len(stack) - argument :]
+            del stack[len(stack) - argument :]
+            output.write("".join([str(value) + " " for value in values]) + "\n")
+        elif opcode == RETURN:
+            return pop(), False
+        else:
+            raise Exception(f"Unknown opcode {opcode} at {pc - 2}.")
+
+
+def disassemble(code):
+    """
+    one line per instruction: index, opcode name, argument and what it refers to
+    """
+    instructions = code["instructions"]
+    targets = set()
+    for pc in range(0, len(instructions), 2):
+        if instructions[pc] in jump_opcodes:
+            targets.add(instructions[pc + 1])
+    lines = []
+    for pc in range(0, len(instructions), 2):
+        opcode = instructions[pc]
+        argument = instructions[pc + 1]
+        marker = ">>" if pc in targets else "  "
+        line = f"{marker} {pc:4} {opcode_names[opcode]:<20}"
+        if opcode == LOAD_CONST:
+            line += f" {argument:4} ({code['constants'][argument]!r})"
+        elif opcode in [LOAD_NAME, STORE_NAME]:
+            line += f" {argument:4} ({code['names'][argument]})"
+        elif opcode in jump_opcodes:
+            line += f" {argument:4}"
+        elif opcode == PRINT:
+            line += f" {argument:4}"
+        lines.append(line.rstrip())
+    return "\n".join(lines)
+
+
+def test_compile_expression():
+    print("test compile expression")
+    code = compile_program(parse(tokenize("x + 2 * 2")))
+    assert list(code["instructions"]) == [
+        LOAD_NAME, 0,
+        LOAD_CONST, 0,
+        LOAD_CONST, 0,
+        MULTIPLY, 0,
+        ADD, 0,
+        RETURN, 0,
+    ]
+    assert code["constants"] == [2]
+    assert code["names"] == ["x"]
+
+
+def test_constant_pool():
+    print("test constant pool")
+    code = compile_program(parse(tokenize("print(1, 1.0, 1, x, x)")))
+    assert code["constants"] == [1, 1.0, None]
+    assert code["names"] == ["x"]
+    # -0.0 only comes from folding, so build the number nodes directly
+    ast = {
+        "tag": "print",
+        "arguments": {
+            "tag": "number",
+            "value": 0.0,
+            "next": {"tag": "number", "value": -0.0},
+        },
+    }
+    code = compile_program(ast)
+    assert [repr(value) for value in code["constants"]] == ["0.0", "-0.0", "None"]
+    with output.redirect(output.ListSink()) as printed:
+        run(code, {})
+    assert printed.getvalue() == "0.0 -0.0 \n"
+
+
+def test_while_uses_jumps():
+    print("test while uses jumps")
+    code = compile_program(parse(tokenize("while(i) i = i-1")))
+    assert disassemble(code) == "\n".join(
+        [
+            ">>    0 LOAD_NAME               0 (i)",
+            "      2 JUMP_IF_FALSE          14",
+            "      4 LOAD_NAME               0 (i)",
+            "      6 LOAD_CONST              0 (1)",
+            "      8 SUBTRACT",
+            "     10 STORE_NAME              0 (i)",
+            "     12 JUMP                    0",
+            ">>   14 LOAD_CONST              1 (None)",
+            "     16 RETURN",
+        ]
+    )
+    environment = {"i": 4}
+    assert run(code, environment) == (None, False)
+    assert environment == {"i": 0}
+
+
+def test_short_circuit_jumps():
+    print("test short circuit jumps")
+    code = compile_program(parse(tokenize("a && b")))
+    assert disassemble(code) == "\n".join(
+        [
+            "      0 LOAD_NAME               0 (a)",
+            "      2 JUMP_IF_FALSE_OR_POP    6",
+            "      4 LOAD_NAME               1 (b)",
+            ">>    6 TO_INT",
+            "      8 RETURN",
+        ]
+    )
+    assert run(code, {"a": 0, "b": 5}) == (0, False)
+    assert run(code, {"a": 1, "b": 5}) == (5, False)
+
+
+def test_compile_unknown_tag():
+    print("test compile unknown tag")
+    try:
+        compile_program({"tag": "return"})
+        assert False, "expected an exception for an unknown tag"
+    except Exception as e:
+        assert str(e) == "Unknown token in AST: return"
+
+
+def test_same_as_evaluator():
+    print("test same as evaluator")
+
+    def evaluate(ast, environment):
+        return run(compile_program(ast), environment)
+
+    evaluator.assert_same_as_evaluator(evaluate)
+
+
+if __name__ == "__main__":
+    test_compile_expression()
+    test_constant_pool()
+    test_while_uses_jumps()
+    test_short_circuit_jumps()
+    test_compile_unknown_tag()
+    test_same_as_evaluator()
+    print("done.")
@@ -0,0 +1,285 @@
+"""
+cache.py -- keep parsed programs on disk between runs, and in memory
+
+    cache = Cache()                       # TRIVIAL_CACHE_DIR, or ~/.cache/trivial
+    ast = cache.parse(source)             # stack_parser.parse(...), at most once
+    print(cache.statistics)               # {"hits": ..., "misses": ..., ...}
+
+    lines = LineCache(256, cache.parse)   # the last 256 distinct lines, in memory
+    ast = lines.parse(source_line)
+
+An entry is the marshal encoding of the AST. It is stored in a file named
+by a hash of the source text, the parser's name and the tokenizer and
+parser versions, so a changed tokenizer or parser never sees an AST it did
+not build. The cache keeps its files under max_bytes in total. It evicts
+the least recently used files first, using each file's modification time
+as the time it was last used.
+"""
+
+from collections import OrderedDict
+import hashlib
+import marshal
+import os
+import tempfile
+
+import tokenizer
+import stack_parser
+
+default_directory = os.environ.get(
+    "TRIVIAL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "trivial")
+)
+
+suffix = ".ast"
+
+
+def parse_source(source):
+    return stack_parser.parse(tokenizer.tokenize_single_pass(source))
+
+
+class Cache:
+    def __init__(self, directory=default_directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = None  # bytes in the cache, counted when first needed
+        self.statistics = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def key(self, source):
+        versions = f"{tokenizer.version}/{stack_parser.version}/{marshal.version}"
+        text = f"stack_parser/{versions}/{source}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + suffix)
+
+    def load(self, source):
+        """
+        the cached AST for source, or None
+        """
+        path = self.path(self.key(source))
+        try:
+            with open(path, "rb") as file:
+                # one read; marshal.load() on a file reads in small pieces
+                ast = marshal.loads(file.read())
+            os.utime(path)
+        except (OSError, EOFError, ValueError, TypeError):
+            # missing, unreadable or damaged entries are misses
+            self.statistics["misses"] += 1
+            return None
+        self.statistics["hits"] += 1
+        return ast
+
+    def store(self, source, ast):
+        os.makedirs(self.directory, exist_ok=True)
+        data = marshal.dumps(ast)
+        path = self.path(self.key(source))
+        # written under a temporary name and renamed, so readers in other
+        # processes never see half an entry
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        self.statistics["stores"] += 1
+        if self.size is not None:
+            self.size = self.size + len(data) - previous
+        self.evict()
+
+    def entries(self):
+        """
+        [(last used, size, path)] for every entry, least recently used first
+        """
+        found = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return found
+        for name in names:
+            if not name.endswith(suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                continue
+            found.append((status.st_mtime_ns, status.st_size, path))
+        found.sort()
+        return found
+
+    def evict(self):
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+        if self.size <= self.max_bytes:
+            return
+        entries = self.entries()
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size = self.size - size
+            self.statistics["evictions"] += 1
+
+    def parse(self, source):
+        """
+        parse_source(source), from the cache when it has been parsed before
+        """
+        ast = self.load(source)
+        if ast is None:
+            ast = parse_source(source)
+            try:
+                self.store(source, ast)
+            except OSError:
+                # a cache that cannot be written only costs the parse
+                pass
+        return ast
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+        self.size = 0
+
+
+class LineCache:
+    """
+    the ASTs of the most recently parsed sources, up to capacity of them,
+    for a REPL where the same lines come back again and again; the ASTs
+    are shared between uses, so they must not be changed by their users
+    """
+
+    def __init__(self, capacity=256, parse=None):
+        self.capacity = capacity
+        self.parse_source = parse or parse_source
+        self.entries = OrderedDict()
+        self.statistics = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def parse(self, source):
+        ast = self.entries.get(source, None)
+        if ast is not None:
+            self.entries.move_to_end(source)
+            self.statistics["hits"] += 1
+            return ast
+        self.statistics["misses"] += 1
+        ast = self.parse_source(source)
+        if self.capacity > 0:
+            self.entries[source] = ast
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.statistics["evictions"] += 1
+        return ast
+
+    def hit_rate(self):
+        lookups = self.statistics["hits"] + self.statistics["misses"]
+        return self.statistics["hits"] / lookups if lookups else 0.0
+
+
+def format_statistics(statistics):
+    return ", ".join(f"{count} {name}" for name, count in statistics.items())
+
+
+def format_line_statistics(lines):
+    return (
+        f"{format_statistics(lines.statistics)}, "
+        f"{lines.hit_rate():.0%} hit rate, {len(lines.entries)}/{lines.capacity} lines"
+    )
+
+
+def test_hits_and_misses():
+    print("test hits and misses")
+    with tempfile.TemporaryDirectory() as directory:
+        cache = Cache(directory)
+        code = "{x=3; y=0; while (x>0) {x=x-1;y=y+1}; print(x, y)}"
+        ast = cache.parse(code)
+        assert ast == parse_source(code)
+        assert cache.parse(code) == ast
+        assert cache.statistics == {"hits": 1, "misses": 1, "stores": 1, "evictions": 0}
+        # a new process sees the same entry
+        other = Cache(directory)
+        assert other.parse(code) == ast
+        assert other.statistics["hits"] == 1
+        assert format_statistics(other.statistics) == "1 hits, 0 misses, 0 stores, 0 evictions"
+
+
+def test_versions_change_keys():
+    print("test versions change keys")
+    cache = Cache("unused")
+    key = cache.key("x = 1")
+    stack_parser.version = stack_parser.version + 1
+    try:
+        assert cache.key("x = 1") != key
+    finally:
+        stack_parser.version = stack_parser.version - 1
+    assert cache.key("x = 1") == key
+    assert cache.key("x = 2") != key
+    # entries written when the cache parsed with parser.py never match
+    for versions in ["1/1", "1/2"]:
+        text = f"{versions}/{marshal.version}/x = 1"
+        assert key != hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def test_damaged_entry():
+    print("test damaged entry")
+    with tempfile.TemporaryDirectory() as directory:
+        cache = Cache(directory)
+        cache.parse("x + 1")
+        with open(cache.path(cache.key("x + 1")), "wb") as file:
+            file.write(b"\xff")
+        assert cache.parse("x + 1") == parse_source("x + 1")
+        assert cache.statistics["misses"] == 2
+
+
+def test_least_recently_used_eviction():
+    print("test least recently used eviction")
+    with tempfile.TemporaryDirectory() as directory:
+        sources = [f"x{index} = {index}" for index in range(4)]
+        size = len(marshal.dumps(parse_source(sources[0])))
+        cache = Cache(directory, max_bytes=3 * size)
+        for index, source in enumerate(sources[:3]):
+            cache.parse(source)
+            os.utime(cache.path(cache.key(source)), ns=(index, index))
+        cache.parse(sources[0])  # now the most recently used
+        cache.parse(sources[3])
+        assert cache.statistics["evictions"] == 1
+        assert not os.path.exists(cache.path(cache.key(sources[1])))
+        for source in [sources[0], sources[2], sources[3]]:
+            assert os.path.exists(cache.path(cache.key(source))), source
+        assert sum(size for _, size, _ in cache.entries()) <= cache.max_bytes
+
+
+def test_line_cache():
+    print("test line cache")
+    parsed = []
+
+    def counted_parse(source):
+        parsed.append(source)
+        return parse_source(source)
+
+    lines = LineCache(2, counted_parse)
+    for source in ["x = 1", "x + 1", "x = 1", "y", "x = 1", "x + 1"]:
+        assert lines.parse(source) == parse_source(source)
+    assert parsed == ["x = 1", "x + 1", "y", "x + 1"]
+    assert lines.statistics == {"hits": 2, "misses": 4, "evictions": 2}
+    assert list(lines.entries) == ["x = 1", "x + 1"]
+    assert format_line_statistics(lines) == (
+        "2 hits, 4 misses, 2 evictions, 33% hit rate, 2/2 lines"
+    )
+    lines = LineCache(0)
+    assert lines.parse("x") == parse_source("x")
+    lines.parse("x")
+    assert lines.statistics["misses"] == 2 and not lines.entries
+
+
+if __name__ == "__main__":
+    test_hits_and_misses()
+    test_versions_change_keys()
+    test_damaged_entry()
+    test_least_recently_used_eviction()
+    test_line_cache()
+    print("done.")
@@ -0,0 +1,328 @@
+"""
+compiler.py -- turn an AST into nested Python closures, once
+
+The closures do the work of evaluator.evaluate without looking at the AST
+again, so a program that is run many times only pays for the tree walk once.
+
+    program = compile_program(parse(tokenize(code)))
+    value, returning = program(environment)
+"""
+
+import operator
+
+from tokenizer import tokenize
+from parser import parse
+import evaluator
+import output
+
+
+def compile_program(ast):
+    """
+    compile a statement AST into a callable taking an environment and
+    returning (value, returning), as evaluate(ast, environment) would
+    """
+    return compile_statement(ast)
+
+
+def compile_statement(ast):
+    """
+    statement = if_statement | while_statement | print_statement | block_statement | expression;
+    statements compile to functions returning (value, returning)
+    """
+    tag = ast["tag"]
+    if tag == "if":
+        return compile_if(ast)
+    if tag == "while":
+        return compile_while(ast)
+    if tag == "print":
+        return compile_print(ast)
+    if tag == "block":
+        return compile_block(ast)
+    expression = compile_expression(ast)
+
+    def run_expression(environment):
+        return expression(environment), False
+
+    return run_expression
+
+
+def compile_if(ast):
+    condition = compile_expression(ast["condition"])
+    then_statement = compile_statement(ast["then"])
+    if not ast.get("else", None):
+
+        def run_if(environment):
+            if condition(environment):
+                value, _ = then_statement(environment)
+                return value, False
+            return None, False
+
+        return run_if
+    else_statement = compile_statement(ast["else"])
+
+    def run_if_else(environment):
+        if condition(environment):
+            value, _ = then_statement(environment)
+        else:
+            value, _ = else_statement(environment)
+        return value, False
+
+    return run_if_else
+
+
+def compile_while(ast):
+    condition = compile_expression(ast["condition"])
+    do_statement = compile_statement(ast["do"])
+
+    def run_while(environment):
+        while condition(environment):
+            do_statement(environment)
+        return None, False
+
+    return run_while
+
+
+def compile_print(ast):
+    arguments = []
+    argument = ast.get("arguments", None)
+    if type(argument) is list:
+        arguments = [compile_expression(argument) for argument in argument]
+        argument = None
+    while argument:
+        arguments.append(compile_expression(argument))
+        argument = argument.get("next", None)
+
+    def run_print(environment):
+        for argument in arguments:
+            output.write(str(argument(environment)) + " ")
+        output.write("\n")
+        return None, False
+
+    return run_print
+
+
+def compile_block(ast):
+    """
+    the "next" chain of a block becomes a list of statements run in a loop
+    """
+    statements = []
+    if "statements" in ast:
+        statements = [compile_statement(statement) for statement in ast["statements"]]
+        ast = None
+    while ast:
+        statements.append(compile_statement(ast["statement"]))
+        ast = ast.get("next")
+
+    def run_block(environment):
+        value, returning = None, False
+        for statement in statements:
+            value, returning = statement(environment)
+            if returning:
+                break
+        return value, returning
+
+    return run_block
+
+
+def compile_expression(ast):
+    """
+    expressions compile to functions returning the value alone
+    """
+    tag = ast["tag"]
+    if tag == "number":
+        return compile_number(ast)
+    if tag == "identifier":
+        return compile_identifier(ast)
+    if tag == "=":
+        return compile_assignment(ast)
+    if tag == "negate":
+        return compile_negate(ast)
+    if tag == "not":
+        return compile_not(ast)
+    if tag == "&&":
+        return compile_and(ast)
+    if tag == "||":
+        return compile_or(ast)
+    if tag in binary_operators:
+        return compile_binary(ast)
+    if tag in ["if", "while", "print", "block"]:
+        statement = compile_statement(ast)
+
+        def run_statement(environment):
+            value, _ = statement(environment)
+            return value
+
+        return run_statement
+    raise Exception(f"Unknown token in AST: {tag}")
+
+
+def compile_number(ast):
+    value = ast["value"]
+    assert type(value) in [
+        float,
+        int,
+    ], f"unexpected ast numeric value {value} is a {type(value)}."
+
+    def run_number(environment):
+        return value
+
+    return run_number
+
+
+def compile_identifier(ast):
+    identifier = ast["value"]
+    assert (
+        type(identifier) is str
+    ), f"unexpected ast identifier value {identifier} is a {type(identifier)}."
+
+    def run_identifier(environment):
+        while environment:
+            if identifier in environment:
+                return environment[identifier]
+            environment = environment.get("$parent", None)
+        return None
+
+    return run_identifier
+
+
+def compile_assignment(ast):
+    assert (
+        ast["target"]["tag"] == "identifier"
+    ), f"ERROR: Expecting identifier in assignment statement."
+    identifier = ast["target"]["value"]
+    assert ast["value"], f"ERROR: Expecting expression in assignment statement."
+    value = compile_expression(ast["value"])
+
+    def run_assignment(environment):
+        environment[identifier] = value(environment)
+        return None
+
+    return run_assignment
+
+
+def compile_negate(ast):
+    value = compile_expression(ast["value"])
+
+    def run_negate(environment):
+        return -value(environment)
+
+    return run_negate
+
+
+def compile_not(ast):
+    value = compile_expression(ast["value"])
+
+    def run_not(environment):
+        if value(environment):
+            return 0
+        return 1
+
+    return run_not
+
+
+def compile_and(ast):
+    left = compile_expression(ast["left"])
+    right = compile_expression(ast["right"])
+
+    def run_and(environment):
+        left_value = left(environment)
+        if not left_value:
+            return int(left_value)
+        return int(right(environment))
+
+    return run_and
+
+
+def compile_or(ast):
+    left = compile_expression(ast["left"])
+    right = compile_expression(ast["right"])
+
+    def run_or(environment):
+        left_value = left(environment)
+        if left_value:
+            return int(left_value)
+        return int(right(environment))
+
+    return run_or
+
+
+# "&&" and "||" short-circuit when compiled; their entries here give the
+# value of the operator once both operands are known, as for constant folding
+binary_operators = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "<": lambda left, right: int(left < right),
+    ">": lambda left, right: int(left > right),
+    "<=": lambda left, right: int(left <= right),
+    ">=": lambda left, right: int(left >= right),
+    "==": lambda left, right: int(left == right),
+    "!=": lambda left, right: int(left != right),
+    "&&": lambda left, right: int(left and right),
+    "||": lambda left, right: int(left or right),
+}
+
+
+def compile_binary(ast):
+    operation = binary_operators[ast["tag"]]
+    left = compile_expression(ast["left"])
+    right = compile_expression(ast["right"])
+
+    def run_binary(environment):
+        return operation(left(environment), right(environment))
+
+    return run_binary
+
+
+def test_compile_number():
+    print("test compile number")
+    program = compile_program(parse(tokenize("4")))
+    assert program({}) == (4, False)
+
+
+def test_compile_identifier():
+    print("test compile identifier")
+    program = compile_program(parse(tokenize("x")))
+    assert program({}) == (None, False)
+    assert program({"x": 3.0}) == (3.0, False)
+    assert program({"y": 3.0, "$parent": {"y": 4.0, "$parent": {"x": 5.5}}}) == (
+        5.5,
+        False,
+    )
+
+
+def test_compile_unknown_tag():
+    print("test compile unknown tag")
+    try:
+        compile_program({"tag": "return"})
+        assert False, "expected an exception for an unknown tag"
+    except Exception as e:
+        assert str(e) == "Unknown token in AST: return"
+
+
+def test_compiled_program_is_reusable():
+    print("test compiled program is reusable")
+    program = compile_program(parse(tokenize("{y=0; while(x>0) {x=x-1; y=y+2}}")))
+    for x in [0, 1, 5]:
+        environment = {"x": x}
+        program(environment)
+        assert environment == {"x": 0, "y": 2 * x}
+
+
+def test_same_as_evaluator():
+    print("test same as evaluator")
+
+    def evaluate(ast, environment):
+        return compile_program(ast)(environment)
+
+    evaluator.assert_same_as_evaluator(evaluate)
+
+
+if __name__ == "__main__":
+    test_compile_number()
+    test_compile_identifier()
+    test_compile_unknown_tag()
+    test_compiled_program_is_reusable()
+    test_same_as_evaluator()
+    print("done.")
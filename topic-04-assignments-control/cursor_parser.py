@@ -0,0 +1,497 @@
+"""
+cursor_parser.py -- the parser.py grammar over a shared token list
+
+Every parse_* function takes the token list and the index of the current
+token, and returns the new node with the index of the first unconsumed
+token. The token list is never copied, so parsing is linear in the number
+of tokens. The ASTs are identical to the ones built by parser.py, but the
+tokens are only read: leaf nodes are new dictionaries, so the tokens may be
+the compact Token objects of tokenizer.tokenize_compact().
+
+Expressions are parsed by precedence climbing over a table of binding
+powers, so a primary is reached in a fixed number of calls rather than one
+call per precedence level. The per-level functions are kept, reached
+through parse_expression_by_levels().
+"""
+
+"""
+    simple_expression = number | identifier | "(" expression ")" | "-" simple_expression
+    factor = simple_expression;
+    term = factor { "*"|"/" factor };
+    math_expression = term { "+"|"-" term };
+    relational_expression = math_expression { ("<" | ">" | "<=" | ">=" | "==" | "!=") math_expression };
+    logical_factor = relational_expression | "!" logical_factor;
+    logical_term = logical_factor { "&&" logical_factor };
+    logical_expression = logical_term { "||" logical_term };
+
+    expression = logical_expression [ "=" math_expression ]
+    expression_list = "(" [ expression { "," expression } ] ")";
+    print_statement = "print" expression_list
+    if_statement = "if" "(" expression ")" statement [ "else" statement ];
+    while_statement = "while" "(" expression ")" statement;
+    block_statement = "{" {";"} [ statement { ";" {";"} statement } {";"} ] "}";
+
+    statement = if_statement | while_statement | print_statement | block_statement | expression;
+    program = statement;
+"""
+
+from tokenizer import tokenize, tokenize_compact, tokenize_bytes
+import parser
+
+
+def parse_simple_expression(tokens, current):
+    """
+    simple_expression = number | identifier | "(" expression ")" | "-" simple_expression
+    """
+    token = tokens[current]
+    tag = token["tag"]
+    if tag == "number" or tag == "identifier":
+        node = {"tag": tag, "value": token["value"], "position": token["position"]}
+        return node, current + 1
+    if tag == "(":
+        node, current = parse_expression_by_levels(tokens, current + 1)
+        assert tokens[current]["tag"] == ")", "Error: expected ')'"
+        return node, current + 1
+    if tag == "-":
+        node, current = parse_simple_expression(tokens, current + 1)
+        return {"tag": "negate", "value": node, "position": token["position"]}, current
+    raise Exception(f"Error: unexpected token '{tag}' at position {token['position']}.")
+
+
+def parse_factor(tokens, current):
+    """
+    factor = simple_expression;
+    """
+    return parse_simple_expression(tokens, current)
+
+
+def parse_term(tokens, current):
+    """
+    term = factor { "*"|"/" factor };
+    """
+    node, current = parse_factor(tokens, current)
+    while tokens[current]["tag"] in ["*", "/"]:
+        operator, position = tokens[current]["tag"], tokens[current]["position"]
+        new_node, current = parse_factor(tokens, current + 1)
+        node = {"tag": operator, "left": node, "right": new_node, "position": position}
+    return node, current
+
+
+def parse_math_expression(tokens, current):
+    """
+    math_expression = term { "+"|"-" term };
+    """
+    node, current = parse_term(tokens, current)
+    while tokens[current]["tag"] in ["+", "-"]:
+        operator, position = tokens[current]["tag"], tokens[current]["position"]
+        new_node, current = parse_term(tokens, current + 1)
+        node = {"tag": operator, "left": node, "right": new_node, "position": position}
+    return node, current
+
+
+def parse_relational_expression(tokens, current):
+    """
+    relational_expression = math_expression { ("<" | ">" | "<=" | ">=" | "==" | "!=") math_expression };
+    """
+    node, current = parse_math_expression(tokens, current)
+    while tokens[current]["tag"] in ["<", ">", "<=", ">=", "==", "!="]:
+        tag, position = tokens[current]["tag"], tokens[current]["position"]
+        next_node, current = parse_math_expression(tokens, current + 1)
+        node = {"tag": tag, "left": node, "right": next_node, "position": position}
+    return node, current
+
+
+def parse_logical_factor(tokens, current):
+    """
+    logical_factor = relational_expression | "!" logical_factor;
+    """
+    if tokens[current]["tag"] == "!":
+        position = tokens[current]["position"]
+        node, current = parse_logical_factor(tokens, current + 1)
+        return {"tag": "not", "value": node, "position": position}, current
+    return parse_relational_expression(tokens, current)
+
+
+def parse_logical_term(tokens, current):
+    """
+    logical_term = logical_factor { "&&" logical_factor };
+    """
+    node, current = parse_logical_factor(tokens, current)
+    while tokens[current]["tag"] == "&&":
+        position = tokens[current]["position"]
+        next_node, current = parse_logical_factor(tokens, current + 1)
+        node = {"tag": "&&", "left": node, "right": next_node, "position": position}
+    return node, current
+
+
+def parse_logical_expression(tokens, current):
+    """
+    logical_expression = logical_term { "||" logical_term };
+    """
+    node, current = parse_logical_term(tokens, current)
+    while tokens[current]["tag"] == "||":
+        position = tokens[current]["position"]
+        next_node, current = parse_logical_term(tokens, current + 1)
+        node = {"tag": "||", "left": node, "right": next_node, "position": position}
+    return node, current
+
+
+def parse_expression_by_levels(tokens, current):
+    """
+    expression = logical_expression [ "=" math_expression ]
+
+    one function per precedence level, as in parser.py; parse_expression()
+    gives the same ASTs
+    """
+    node, current = parse_logical_expression(tokens, current)
+    if tokens[current]["tag"] == "=":
+        position = tokens[current]["position"]
+        value, current = parse_math_expression(tokens, current + 1)
+        node = {"tag": "=", "target": node, "value": value, "position": position}
+    return node, current
+
+
+# precedence climbing: the binding power of each binary operator, with all
+# of them left associative. "!" applies to a relational expression (a
+# logical_factor), so it is only allowed where an operand of "&&" or "||"
+# may start; unary "-" applies to a simple_expression.
+
+binding_powers = {
+    "||": 1,
+    "&&": 2,
+    "<": 3,
+    ">": 3,
+    "<=": 3,
+    ">=": 3,
+    "==": 3,
+    "!=": 3,
+    "+": 4,
+    "-": 4,
+    "*": 5,
+    "/": 5,
+}
+
+relational_power = 3
+additive_power = 4
+
+
+def wrap_unary(tag, tokens, first, stop, node):
+    """
+    node inside one tag node for each of the signs tokens[first:stop],
+    the sign nearest to node innermost
+    """
+    for index in range(stop - 1, first - 1, -1):
+        node = {"tag": tag, "value": node, "position": tokens[index]["position"]}
+    return node
+
+
+def parse_primary(tokens, current):
+    """
+    simple_expression = number | identifier | "(" expression ")" | "-" simple_expression
+    """
+    token = tokens[current]
+    tag = token["tag"]
+    if tag == "number" or tag == "identifier":
+        node = {"tag": tag, "value": token["value"], "position": token["position"]}
+        return node, current + 1
+    if tag == "(":
+        node, current = parse_expression(tokens, current + 1)
+        assert tokens[current]["tag"] == ")", "Error: expected ')'"
+        return node, current + 1
+    if tag == "-":
+        # a chain of minus signs, without a call per sign
+        first = current
+        while tokens[current]["tag"] == "-":
+            current = current + 1
+        stop = current
+        node, current = parse_primary(tokens, current)
+        return wrap_unary("negate", tokens, first, stop, node), current
+    raise Exception(f"Error: unexpected token '{tag}' at position {token['position']}.")
+
+
+def parse_operators(tokens, current, min_power):
+    """
+    an expression of binary operators binding at least as tightly as min_power
+    """
+    if min_power <= relational_power and tokens[current]["tag"] == "!":
+        # logical_factor = relational_expression | "!" logical_factor
+        first = current
+        while tokens[current]["tag"] == "!":
+            current = current + 1
+        stop = current
+        node, current = parse_operators(tokens, current, relational_power)
+        node = wrap_unary("not", tokens, first, stop, node)
+    else:
+        node, current = parse_primary(tokens, current)
+    while True:
+        tag = tokens[current]["tag"]
+        power = binding_powers.get(tag, 0)
+        if power < min_power:
+            return node, current
+        position = tokens[current]["position"]
+        right, current = parse_operators(tokens, current + 1, power + 1)
+        node = {"tag": tag, "left": node, "right": right, "position": position}
+
+
+def parse_expression(tokens, current):
+    """
+    expression = logical_expression [ "=" math_expression ]
+    """
+    node, current = parse_operators(tokens, current, 1)
+    if tokens[current]["tag"] == "=":
+        position = tokens[current]["position"]
+        value, current = parse_operators(tokens, current + 1, additive_power)
+        node = {"tag": "=", "target": node, "value": value, "position": position}
+    return node, current
+
+
+def parse_expression_list(tokens, current):
+    """
+    expression_list = "(" [ expression { "," expression } ] ")";
+    """
+    assert tokens[current]["tag"] == "(", "Error: expected '('"
+    current = current + 1
+    first_node = None
+    if tokens[current]["tag"] != ")":
+        node, current = parse_expression(tokens, current)
+        first_node = node
+        while tokens[current]["tag"] != ")":
+            assert tokens[current]["tag"] == ",", "Error: expected ','"
+            node["next"], current = parse_expression(tokens, current + 1)
+            node = node["next"]
+    return first_node, current + 1
+
+
+def parse_if_statement(tokens, current):
+    """
+    if_statement = "if" "(" expression ")" statement [ "else" statement ];
+    """
+    assert tokens[current]["tag"] == "if"
+    position = tokens[current]["position"]
+    assert tokens[current + 1]["tag"] == "(", "Error: expected '('"
+    condition, current = parse_expression(tokens, current + 2)
+    assert tokens[current]["tag"] == ")", "Error: expected ')'"
+    then_statement, current = parse_statement(tokens, current + 1)
+    node = {"tag": "if", "condition": condition, "then": then_statement, "position": position}
+    if tokens[current]["tag"] == "else":
+        node["else"], current = parse_statement(tokens, current + 1)
+    return node, current
+
+
+def parse_while_statement(tokens, current):
+    """
+    while_statement = "while" "(" expression ")" statement;
+    """
+    assert tokens[current]["tag"] == "while"
+    position = tokens[current]["position"]
+    assert tokens[current + 1]["tag"] == "(", "Error: expected '('"
+    condition, current = parse_expression(tokens, current + 2)
+    assert tokens[current]["tag"] == ")", "Error: expected ')'"
+    do_statement, current = parse_statement(tokens, current + 1)
+    node = {"tag": "while", "condition": condition, "do": do_statement, "position": position}
+    return node, current
+
+
+def parse_print_statement(tokens, current):
+    """
+    print_statement = "print" expression_list
+    """
+    assert tokens[current]["tag"] == "print"
+    position = tokens[current]["position"]
+    arguments, current = parse_expression_list(tokens, current + 1)
+    return {"tag": "print", "arguments": arguments, "position": position}, current
+
+
+def parse_block_statement(tokens, current):
+    """
+    block_statement = "{" {";"} [ statement { ";" {";"} statement } {";"} ] "}";
+    """
+    assert tokens[current]["tag"] == "{"
+    node = {"tag": "block", "position": tokens[current]["position"]}
+    current = current + 1
+    first_node = node
+    while tokens[current]["tag"] == ";":
+        current = current + 1
+    if tokens[current]["tag"] != "}":
+        node["statement"], current = parse_statement(tokens, current)
+        while tokens[current]["tag"] == ";":
+            while tokens[current]["tag"] == ";":
+                current = current + 1
+            if tokens[current]["tag"] != "}":
+                statement, current = parse_statement(tokens, current)
+                node["next"] = continuation(statement)
+                node = node["next"]
+            assert tokens[current]["tag"] in [";", "}"], "Error: expected ';' or '}'"
+    assert tokens[current]["tag"] == "}", "Error: expected ';' or '}'"
+    return first_node, current + 1
+
+
+def continuation(statement):
+    """
+    the cell linking statement into a block after the first; it has no
+    token of its own, so it takes the position of its statement
+    """
+    return {"tag": "block", "statement": statement, "position": statement["position"]}
+
+
+def parse_statement(tokens, current):
+    """
+    statement = if_statement | while_statement | print_statement | block_statement | expression;
+    """
+    tag = tokens[current]["tag"]
+    if tag == "if":
+        return parse_if_statement(tokens, current)
+    if tag == "while":
+        return parse_while_statement(tokens, current)
+    if tag == "print":
+        return parse_print_statement(tokens, current)
+    if tag == "{":
+        return parse_block_statement(tokens, current)
+    return parse_expression(tokens, current)
+
+
+def parse_program(tokens, current):
+    """
+    programs = statement;
+    """
+    return parse_statement(tokens, current)
+
+
+def parse(tokens):
+    ast, _ = parse_program(tokens, 0)
+    return ast
+
+
+# programs covering every rule of the grammar, shared by the tests of the
+# other parsers
+
+sample_programs = [
+    "2",
+    "x",
+    "-2",
+    "--x",
+    "2*3/4",
+    "1+2*3-4/x",
+    "(1+2)*3",
+    "-(1+2)*-3",
+    "x < y",
+    "1 + 2 <= 3 * 4 != 0",
+    "!x",
+    "!!x < 3 && y",
+    "a && b || c && !d",
+    "a || b || c",
+    "x = 1",
+    "x = y * (z + 1)",
+    "i+2+3+4=i",
+    "print()",
+    "print(1)",
+    "print(1, x+2, (y))",
+    "if(1) print(1)",
+    "if(x < 3) print(1) else print(2)",
+    "if(a) if(b) x=1 else x=2",
+    "while(i) i = i-1",
+    "while(i < 10 && !done) { i = i + 1; print(i) }",
+    "{}",
+    "{;;}",
+    "{x=1}",
+    "{;x=1;;y=2;}",
+    "{x=3; y=0; while (x>0) {x=x-1;y=y+1}; print(x, y)}",
+    "{ {x=1}; {y=2; {z=3}} }",
+]
+
+
+def test_parse_simple_expression():
+    print("test parse simple expression")
+    ast, current = parse_simple_expression(tokenize("2"), 0)
+    assert ast == {"tag": "number", "value": 2, "position": 0}
+    assert current == 1
+    ast, current = parse_simple_expression(tokenize("-2"), 0)
+    assert ast == {
+        "tag": "negate",
+        "value": {"tag": "number", "value": 2, "position": 1},
+        "position": 0,
+    }
+    assert current == 2
+    try:
+        parse_simple_expression(tokenize(")"), 0)
+        assert False, "expected an exception for an unexpected token"
+    except Exception as e:
+        assert "unexpected token" in str(e)
+
+
+def test_parse_expression_list():
+    print("test parse expression list")
+    ast, current = parse_expression_list(tokenize("()"), 0)
+    assert ast == None
+    assert current == 2
+    ast, current = parse_expression_list(tokenize("(1,2)"), 0)
+    assert ast == {
+        "tag": "number",
+        "value": 1,
+        "position": 1,
+        "next": {"tag": "number", "value": 2, "position": 3},
+    }
+    assert current == 5
+
+
+def test_cursor_positions():
+    print("test cursor positions")
+    tokens = tokenize("x = 1; y")
+    ast, current = parse_statement(tokens, 0)
+    assert tokens[current]["tag"] == ";"
+    ast, current = parse_statement(tokens, current + 1)
+    assert ast == {"tag": "identifier", "value": "y", "position": 7}
+    assert tokens[current]["tag"] == "end"
+
+
+def test_same_ast_as_parser():
+    print("test same ast as parser")
+    for code in sample_programs:
+        assert parse(tokenize(code)) == parser.parse(tokenize(code)), code
+
+
+def test_precedence_climbing():
+    print("test precedence climbing")
+    for code in [
+        "1 - 2 - 3",
+        "8 / 4 / 2 * 3",
+        "-1 * -(2 + 3) - -x",
+        "1 < 2 < 3 != x",
+        "!a && !!b || !(c) && d",
+        "!x + 1 < 3",
+        "a || b && c || d && e && f",
+        "x = a < b",
+        "x = 1 + 2 * 3 - 4",
+    ]:
+        tokens = tokenize(code)
+        expected, expected_current = parse_expression_by_levels(tokens, 0)
+        assert parse_expression(tokens, 0) == (expected, expected_current), code
+    for code in ["x < !y", "1 + !x", "x = !y", "(1", "* 2", "1 + "]:
+        errors = []
+        for parse_function in [parse_expression, parse_expression_by_levels]:
+            try:
+                parse_function(tokenize(code), 0)
+            except Exception as e:
+                errors.append((type(e), str(e)))
+            else:
+                raise Exception(f"{parse_function.__name__} accepted {code!r}")
+        assert errors[0] == errors[1], (code, errors)
+
+
+def test_compact_tokens():
+    print("test compact tokens")
+    for code in sample_programs:
+        tokens = tokenize_compact(code)
+        assert parse(tokens) == parser.parse(tokenize(code)), code
+        assert tokens == tokenize(code), code
+        assert parse(tokenize_bytes(code.encode("ascii"))) == parse(tokens), code
+
+
+if __name__ == "__main__":
+    test_parse_simple_expression()
+    test_parse_expression_list()
+    test_cursor_positions()
+    test_same_ast_as_parser()
+    test_precedence_climbing()
+    test_compact_tokens()
+    print("done.")
@@ -0,0 +1,186 @@
+"""
+dispatch_evaluator.py -- evaluate ASTs through a table of handlers keyed by tag
+
+Behaves like evaluator.evaluate, but each node costs one dictionary lookup
+instead of a walk down the chain of tag comparisons.
+
+    value, returning = evaluate(ast, environment)
+"""
+
+import operator
+
+import evaluator
+import output
+
+
+def evaluate(ast, environment):
+    try:
+        handler = handlers[ast["tag"]]
+    except KeyError:
+        raise Exception(f"Unknown token in AST: {ast['tag']}")
+    return handler(ast, environment)
+
+
+def evaluate_number(ast, environment):
+    assert type(ast["value"]) in [
+        float,
+        int,
+    ], f"unexpected ast numeric value {ast['value']} is a {type(ast['value'])}."
+    return ast["value"], False
+
+
+def evaluate_identifier(ast, environment):
+    assert (
+        type(ast["value"]) is str
+    ), f"unexpected ast identifier value {ast['value']} is a {type(ast['value'])}."
+    identifier = ast["value"]
+    while environment:
+        if identifier in environment:
+            return environment[identifier], False
+        environment = environment.get("$parent", None)
+    return None, False
+
+
+def evaluate_if(ast, environment):
+    condition, _ = evaluate(ast["condition"], environment)
+    if condition:
+        value, _ = evaluate(ast["then"], environment)
+        return value, False
+    if ast.get("else", None):
+        value, _ = evaluate(ast["else"], environment)
+        return value, False
+    return None, False
+
+
+def evaluate_while(ast, environment):
+    condition, _ = evaluate(ast["condition"], environment)
+    while condition:
+        evaluate(ast["do"], environment)
+        condition, _ = evaluate(ast["condition"], environment)
+    return None, False
+
+
+def evaluate_print(ast, environment):
+    argument = ast.get("arguments", None)
+    if type(argument) is list:
+        for argument in argument:
+            value, _ = evaluate(argument, environment)
+            output.write(str(value) + " ")
+        argument = None
+    while argument:
+        value, _ = evaluate(argument, environment)
+        output.write(str(value) + " ")
+        argument = argument.get("next", None)
+    output.write("\n")
+    return None, False
+
+
+def evaluate_block(ast, environment):
+    if "statements" in ast:
+        value, returning = None, False
+        for statement in ast["statements"]:
+            value, returning = evaluate(statement, environment)
+            if returning:
+                break
+        return value, returning
+    value, returning = evaluate(ast["statement"], environment)
+    if ast.get("next") and not returning:
+        value, returning = evaluate(ast["next"], environment)
+    return value, returning
+
+
+def evaluate_not(ast, environment):
+    value, _ = evaluate(ast["value"], environment)
+    if value:
+        return 0, False
+    return 1, False
+
+
+def evaluate_negate(ast, environment):
+    value, _ = evaluate(ast["value"], environment)
+    return -value, False
+
+
+def evaluate_assignment(ast, environment):
+    assert (
+        ast["target"]["tag"] == "identifier"
+    ), f"ERROR: Expecting identifier in assignment statement."
+    identifier = ast["target"]["value"]
+    assert ast["value"], f"ERROR: Expecting expression in assignment statement."
+    value, _ = evaluate(ast["value"], environment)
+    environment[identifier] = value
+    return None, False
+
+
+def evaluate_and(ast, environment):
+    left_value, _ = evaluate(ast["left"], environment)
+    if not left_value:
+        return int(left_value), False
+    right_value, _ = evaluate(ast["right"], environment)
+    return int(right_value), False
+
+
+def evaluate_or(ast, environment):
+    left_value, _ = evaluate(ast["left"], environment)
+    if left_value:
+        return int(left_value), False
+    right_value, _ = evaluate(ast["right"], environment)
+    return int(right_value), False
+
+
+def binary(operation):
+    """
+    handler for a node that combines its evaluated "left" and "right" children
+    """
+
+    def evaluate_binary(ast, environment):
+        left_value, _ = evaluate(ast["left"], environment)
+        right_value, _ = evaluate(ast["right"], environment)
+        return operation(left_value, right_value), False
+
+    return evaluate_binary
+
+
+handlers = {
+    "number": evaluate_number,
+    "identifier": evaluate_identifier,
+    "if": evaluate_if,
+    "while": evaluate_while,
+    "print": evaluate_print,
+    "block": evaluate_block,
+    "not": evaluate_not,
+    "negate": evaluate_negate,
+    "=": evaluate_assignment,
+    "+": binary(operator.add),
+    "-": binary(operator.sub),
+    "*": binary(operator.mul),
+    "/": binary(operator.truediv),
+    "<": binary(lambda left, right: int(left < right)),
+    ">": binary(lambda left, right: int(left > right)),
+    "<=": binary(lambda left, right: int(left <= right)),
+    ">=": binary(lambda left, right: int(left >= right)),
+    "==": binary(lambda left, right: int(left == right)),
+    "!=": binary(lambda left, right: int(left != right)),
+    "&&": evaluate_and,
+    "||": evaluate_or,
+}
+
+
+def test_unknown_tag():
+    print("test unknown tag")
+    try:
+        evaluate({"tag": "return"}, {})
+        assert False, "expected an exception for an unknown tag"
+    except Exception as e:
+        assert str(e) == "Unknown token in AST: return"
+
+
+def test_same_as_evaluator():
+    print("test same as evaluator")
+    evaluator.assert_same_as_evaluator(evaluate)
+
+
+if __name__ == "__main__":
+    test_unknown_tag()
+    test_same_as_evaluator()
+    print("done.")
@@ -1,5 +1,9 @@
+import contextlib
+import io
+
 from tokenizer import tokenize
 from parser import parse
+import output
 
 
 def evaluate(ast, environment):
@@ -28,6 +32,7 @@ def evaluate(ast, environment):
         if ast.get("else", None):
             value, _ = evaluate(ast["else"], environment)
             return value, False
+        return None, False
 
     if ast["tag"] == "while":
         condition, _ = evaluate(ast["condition"], environment)
@@ -38,14 +43,28 @@ def evaluate(ast, environment):
 
     if ast["tag"] == "print":
         argument = ast.get("arguments", None)
+        if type(argument) is list:
+            # list form (list_form.py)
+            for argument in argument:
+                value, _ = evaluate(argument, environment)
+                output.write(str(value) + " ")
+            argument = None
         while(argument):
             value, _ = evaluate(argument, environment)
-            print(value, end = " ")
+            output.write(str(value) + " ")
             argument = argument.get("next", None)
-        print()
+        output.write("\n")
         return None, False
 
     if ast["tag"] == "block":
+        if "statements" in ast:
+            # list form (list_form.py), run in a loop rather than recursively
+            value, returning = None, False
+            for statement in ast["statements"]:
+                value, returning = evaluate(statement, environment)
+                if returning:
+                    break
+            return value, returning
         value, returning = evaluate(ast["statement"], environment)
         if ast.get("next") and not returning:
             value, returning = evaluate(ast["next"], environment)
@@ -105,12 +124,16 @@ def evaluate(ast, environment):
         return int(left_value != right_value), False
     if ast["tag"] == "&&":
         left_value, _ = evaluate(ast["left"], environment)
+        if not left_value:
+            return int(left_value), False
         right_value, _ = evaluate(ast["right"], environment)
-        return int(left_value and right_value), False
+        return int(right_value), False
     if ast["tag"] == "||":
         left_value, _ = evaluate(ast["left"], environment)
+        if left_value:
+            return int(left_value), False
         right_value, _ = evaluate(ast["right"], environment)
-        return int(left_value or right_value), False
+        return int(right_value), False
     if ast["tag"] == "negate":
         value, _ = evaluate(ast["value"], environment)
         return -value, False
@@ -136,7 +159,7 @@ def equals(code, environment, expected_result, expected_environment=None):
         {[expected_result]},
         --got--
         {[result]}."""
-    if expected_environment:
+    if expected_environment is not None:
         assert (
             environment == expected_environment
         ), f"""
@@ -147,6 +170,57 @@ def equals(code, environment, expected_result, expected_environment=None):
         """
 
 
+def run(evaluate, code, environment):
+    """
+    result, returning flag and printed output of evaluating code
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        value, returning = evaluate(parse(tokenize(code)), environment)
+    return value, returning, output.getvalue()
+
+
+sample_programs = [
+    ("4", {}),
+    ("x", {}),
+    ("x", {"y": 3.0, "$parent": {"x": 4.0}}),
+    ("x", {"y": 3.0, "z": 8.0, "$parent": {"y": 4.0, "$parent": {"x": 5.5}}}),
+    ("1+3*4-10/4", {}),
+    ("(3+4)--(1+2)", {}),
+    ("12/--3", {}),
+    ("x+y+z", {"x": 3.0, "y": 4.0, "z": 5.0}),
+    ("1 < 2", {}),
+    ("2 <= 1 != 1", {}),
+    ("3 > 2 >= 1 != 0", {}),
+    ("!0 && 1 || 0", {}),
+    ("!(x && 0) || x", {"x": 2}),
+    ("print()", {}),
+    ("print(1,2.5,x)", {"x": 7}),
+    ("if(1) print(1111)", {}),
+    ("if(0) print(1111) else print(2222)", {}),
+    ("if(0) x = 1", {}),
+    ("while(i) i = i-1", {"i": 4}),
+    ("{x=4; y=3; y=1}", {}),
+    ("{x=3; y=0; while (x>0) {x=x-1;y=y+1}; print(x, y)}", {}),
+    ("{x=1; {y=x+1; z=y*2}; print(x, y, z)}", {"$parent": {"w": 1}}),
+    ("{0 && (x = 1); 1 || (y = 1); 1 && ((z = 2) || 1); 0 || ((w = 3) || 1)}", {}),
+    ("{i = 0; n = 0; while (i < 3 && ((n = n + 1) || 1)) i = i + 1}", {}),
+]
+
+
+def assert_same_as_evaluator(other_evaluate):
+    """
+    check that other_evaluate agrees with evaluate on every sample program
+    """
+    for code, environment in sample_programs:
+        environment_1 = dict(environment)
+        environment_2 = dict(environment)
+        assert run(other_evaluate, code, environment_1) == run(
+            evaluate, code, environment_2
+        ), code
+        assert environment_1 == environment_2, code
+
+
 def test_evaluate_single_value():
     print("test evaluate single value")
     equals("4", {}, 4, {})
@@ -168,6 +242,7 @@ def test_evaluate_if_statement():
     print("test evaluate if statement.")
     equals("if(1) print(1111)", {}, None, None)
     equals("if(0) print(1111) else print(2222)", {}, None, None)
+    equals("if(0) x = 1", {}, None, {})
 
 
 def test_evaluate_while_statement():
@@ -215,6 +290,24 @@ def test_evaluate_complex_expression():
     equals("(1+2)*3", {}, 9)
 
 
+def test_evaluate_logical_operators():
+    print("test evaluate logical operators")
+    equals("1 && 2", {}, 2)
+    equals("1 && 0", {}, 0)
+    equals("0 || 2.5", {}, 2)
+    equals("0 || 0", {}, 0)
+    equals("!0 && !1", {}, 0)
+
+
+def test_evaluate_short_circuit():
+    print("test evaluate short circuit")
+    environment = {}
+    evaluate(parse(tokenize("{0 && (x = 1); 1 || (y = 1)}")), environment)
+    assert environment == {}
+    evaluate(parse(tokenize("{1 && ((x = 1) || 1); 0 || ((y = 1) || 1)}")), environment)
+    assert environment == {"x": 1, "y": 1}
+
+
 def test_evaluate_block_statement():
     print("test evaluate block statement.")
     equals("{x=4}", {}, None, {"x": 4})
@@ -231,6 +324,8 @@ if __name__ == "__main__":
     test_evaluate_division()
     test_evaluate_unary_negation()
     test_evaluate_complex_expression()
+    test_evaluate_logical_operators()
+    test_evaluate_short_circuit()
     test_evaluate_if_statement()
     test_evaluate_while_statement()
     test_evaluate_print_statement()    
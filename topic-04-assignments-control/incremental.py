@@ -0,0 +1,417 @@
+"""
+incremental.py -- keep the tokens and AST of an edited source up to date
+
+An editor that tokenizes and parses the whole buffer after every keystroke
+does work proportional to the buffer. A Document re-lexes only the tokens
+around an edit, stopping as soon as the new token stream lines up with the
+old one again, and re-parses only the innermost block statement that
+contains every changed token.
+
+    document = Document("{x = 1; y = 2}")
+    document.edit(5, 1, "41")             # offset, deleted length, inserted text
+    document.source                       # "{x = 41; y = 2}"
+    document.tokens, document.ast         # as tokenize() and parse() would give
+
+Positions after the edit move by the change in length, so the tokens past
+the edit are copied and the AST nodes past it, kept in a list in source
+order, are shifted in place. That is still linear in the size of the
+source, but it involves no regex and no parsing. An edit that
+leaves the source unparseable raises as parse() would. The next edit then
+starts over from the whole source.
+"""
+
+from bisect import bisect_left
+import random
+
+from tokenizer import master_pattern, master_tags, keywords, tokenize, tokenize_single_pass
+import cursor_parser
+
+
+def lex_token(source, position):
+    """
+    (token or None for whitespace, position after the match), as
+    tokenize_single_pass() would see the token at position
+    """
+    match = master_pattern.match(source, position)
+    assert (
+        match
+    ), f"Failed to match token with [{source}] finding {source[15:]} at position {position}."
+    tag = master_tags[match.lastgroup]
+    if tag == "#whitespace":
+        return None, match.end()
+    value = match.group(0)
+    if tag == "number":
+        if "." in value:
+            value = float(value)
+        else:
+            value = int(value)
+    elif tag == "identifier" and value in keywords:
+        tag = value
+    return {"tag": tag, "value": value, "position": position}, match.end()
+
+
+def same_token(old, new):
+    return old["tag"] == new["tag"] and old["value"] == new["value"]
+
+
+def relex(source, tokens, offset, deleted, inserted):
+    """
+    apply an edit to source and its tokens, returning (new source, new
+    tokens, damage) where damage = (first, old_stop, new_stop) says that
+    tokens[first:old_stop] were replaced by new_tokens[first:new_stop]
+    """
+    new_source = source[:offset] + inserted + source[offset + deleted :]
+    delta = len(inserted) - deleted
+    edit_end = offset + len(inserted)  # in the new source
+    # a token ending at the edit can grow into it, and a token ending one
+    # character before can depend on it (e.g. "1." followed by a digit), so
+    # start two tokens before the first token at or after the edit
+    first = max(bisect_left(tokens, offset, key=lambda token: token["position"]) - 2, 0)
+    new_tokens = tokens[:first]
+    # only whitespace comes before the first token, so an edit there
+    # starts at the edit
+    position = min(tokens[first]["position"], offset)
+    old_index = first
+    while True:
+        if position == len(new_source):
+            token = {"tag": "end", "value": "", "position": position}
+        else:
+            token, position = lex_token(new_source, position)
+            if token is None:
+                continue
+        if token["position"] >= edit_end:
+            # past the edit the old tokens are valid again from the first
+            # old token at the same text with the same tag and value
+            old_position = token["position"] - delta
+            old_index = bisect_left(
+                tokens, old_position, old_index, key=lambda token: token["position"]
+            )
+            if (
+                old_index < len(tokens)
+                and tokens[old_index]["position"] == old_position
+                and same_token(tokens[old_index], token)
+            ):
+                break
+        new_tokens.append(token)
+    # tokens lexed again before the edit that did not change are not damage
+    while (
+        first < len(new_tokens)
+        and tokens[first]["position"] < offset
+        and tokens[first]["position"] == new_tokens[first]["position"]
+        and same_token(tokens[first], new_tokens[first])
+    ):
+        first = first + 1
+    damage = first, old_index, len(new_tokens)
+    if delta:
+        new_tokens.extend(
+            dict(token, position=token["position"] + delta) for token in tokens[old_index:]
+        )
+    else:
+        new_tokens.extend(tokens[old_index:])
+    return new_source, new_tokens, damage
+
+
+# the spans of a parse are [start, stop, cell] entries: the statement of the
+# block cell `cell` was parsed from tokens[start:stop]
+
+
+def parse_statement(tokens, current, spans):
+    """
+    cursor_parser.parse_statement(), recording the span of every statement
+    in a block
+    """
+    tag = tokens[current]["tag"]
+    position = tokens[current]["position"]
+    if tag == "if":
+        assert tokens[current + 1]["tag"] == "("
+        condition, current = cursor_parser.parse_expression(tokens, current + 2)
+        assert tokens[current]["tag"] == ")"
+        then_statement, current = parse_statement(tokens, current + 1, spans)
+        node = {"tag": "if", "condition": condition, "then": then_statement, "position": position}
+        if tokens[current]["tag"] == "else":
+            node["else"], current = parse_statement(tokens, current + 1, spans)
+        return node, current
+    if tag == "while":
+        assert tokens[current + 1]["tag"] == "("
+        condition, current = cursor_parser.parse_expression(tokens, current + 2)
+        assert tokens[current]["tag"] == ")"
+        do_statement, current = parse_statement(tokens, current + 1, spans)
+        node = {"tag": "while", "condition": condition, "do": do_statement, "position": position}
+        return node, current
+    if tag == "{":
+        return parse_block_statement(tokens, current, spans)
+    # print statements and expressions contain no blocks
+    return cursor_parser.parse_statement(tokens, current)
+
+
+def parse_block_statement(tokens, current, spans):
+    """
+    cursor_parser.parse_block_statement(), recording statement spans
+    """
+    assert tokens[current]["tag"] == "{"
+    node = {"tag": "block", "position": tokens[current]["position"]}
+    current = current + 1
+    first_node = node
+    while tokens[current]["tag"] == ";":
+        current = current + 1
+    if tokens[current]["tag"] != "}":
+        start = current
+        node["statement"], current = parse_statement(tokens, current, spans)
+        spans.append([start, current, node])
+        while tokens[current]["tag"] == ";":
+            while tokens[current]["tag"] == ";":
+                current = current + 1
+            if tokens[current]["tag"] != "}":
+                start = current
+                statement, current = parse_statement(tokens, current, spans)
+                node["next"] = cursor_parser.continuation(statement)
+                node = node["next"]
+                spans.append([start, current, node])
+            assert tokens[current]["tag"] in [";", "}"]
+    assert tokens[current]["tag"] == "}"
+    return first_node, current + 1
+
+
+def parse(tokens):
+    """
+    (ast, spans) for a whole token list
+    """
+    spans = []
+    ast, _ = parse_statement(tokens, 0, spans)
+    return ast, spans
+
+
+def position(node):
+    return node["position"]
+
+
+def positioned_nodes(ast):
+    """
+    the nodes of ast, which all carry a position, in source order
+    """
+    found = []
+    pending = [ast]
+    while pending:
+        node = pending.pop()
+        if "position" in node:
+            found.append(node)
+        for value in node.values():
+            if type(value) is dict:
+                pending.append(value)
+    found.sort(key=position)
+    return found
+
+
+def reparse(tokens, ast, spans, damage):
+    """
+    re-parse the innermost recorded statement enclosing the damaged tokens
+    and splice it into ast in place, returning (start, old stop, new stop,
+    cell) for the tokens it was parsed from and the block cell now holding
+    it; None when no statement could be re-parsed on its own, and the whole
+    program has to be parsed again
+    """
+    first, old_stop, new_stop = damage
+    growth = new_stop - old_stop
+    enclosing = [span for span in spans if span[0] <= first and old_stop <= span[1]]
+    enclosing.sort(key=lambda span: span[1] - span[0])
+    for span in enclosing:
+        start, stop, cell = span
+        inner_spans = []
+        try:
+            statement, current = parse_statement(tokens, start, inner_spans)
+        except Exception:
+            continue
+        if current != stop + growth:
+            continue
+        if cell["position"] == cell["statement"]["position"]:
+            # a continuation cell, positioned at its statement
+            cell["position"] = statement["position"]
+        cell["statement"] = statement
+        spans[:] = [
+            old_span
+            for old_span in spans
+            if old_span is span or not (start <= old_span[0] and old_span[1] <= stop)
+        ]
+        for old_span in spans:
+            if old_span[0] >= stop:
+                old_span[0] = old_span[0] + growth
+            if old_span[1] >= stop:
+                old_span[1] = old_span[1] + growth
+        spans.extend(inner_spans)
+        return start, stop, current, cell
+    return None
+
+
+class Document:
+    """
+    a source string with its tokens and AST, kept current under edits;
+    `statistics` counts the tokens changed and parsed again by the last
+    edit, and the AST nodes whose positions it shifted
+    """
+
+    def __init__(self, source=""):
+        self.source = source
+        self.tokens = None
+        self.ast = None
+        self.spans = []
+        self.positioned_nodes = []  # the AST nodes with a position, in source order
+        self.statistics = {}
+        self.rebuild()
+
+    def rebuild(self):
+        self.tokens = None
+        self.ast = None
+        self.tokens = tokenize_single_pass(self.source)
+        self.ast, self.spans = parse(self.tokens)
+        self.positioned_nodes = positioned_nodes(self.ast)
+        self.statistics = {
+            "changed": len(self.tokens),
+            "reparsed": len(self.tokens),
+            "shifted": 0,
+        }
+
+    def edit(self, offset, deleted, inserted):
+        """
+        replace source[offset:offset + deleted] with inserted, returning the new AST
+        """
+        assert 0 <= offset and offset + deleted <= len(self.source), "edit outside source"
+        if self.ast is None:
+            # the last version did not tokenize or parse; start over
+            self.source = self.source[:offset] + inserted + self.source[offset + deleted :]
+            self.rebuild()
+            return self.ast
+        try:
+            source, tokens, damage = relex(self.source, self.tokens, offset, deleted, inserted)
+        except AssertionError:
+            self.source = self.source[:offset] + inserted + self.source[offset + deleted :]
+            self.tokens = None
+            self.ast = None
+            raise
+        first, old_stop, new_stop = damage
+        old_tokens = self.tokens
+        self.source = source
+        self.tokens = tokens
+        self.statistics = {"changed": new_stop - first, "reparsed": 0, "shifted": 0}
+        if first == old_stop and first == new_stop:
+            # only whitespace changed
+            low = high = bisect_left(self.positioned_nodes, offset + deleted, key=position)
+            replacement = []
+        else:
+            reparsed = reparse(tokens, self.ast, self.spans, damage)
+            if reparsed is None:
+                self.ast = None
+                self.ast, self.spans = parse(tokens)
+                self.positioned_nodes = positioned_nodes(self.ast)
+                self.statistics["reparsed"] = len(tokens)
+                return self.ast
+            start, stop, current, cell = reparsed
+            self.statistics["reparsed"] = current - start
+            # the old nodes of the statement are found by their old positions,
+            # with the cell holding it when that is positioned at the statement
+            low = bisect_left(
+                self.positioned_nodes, old_tokens[start]["position"], key=position
+            )
+            high = bisect_left(
+                self.positioned_nodes, old_tokens[stop]["position"], low, key=position
+            )
+            replacement = positioned_nodes(cell["statement"])
+            if cell["position"] == cell["statement"]["position"]:
+                # a stable sort keeps the cell ahead of its statement, as
+                # positioned_nodes() does
+                replacement = sorted([cell] + replacement, key=position)
+        delta = len(inserted) - deleted
+        if delta:
+            # every node after the edit, not only the leaves, has a position
+            for index in range(high, len(self.positioned_nodes)):
+                self.positioned_nodes[index]["position"] += delta
+            self.statistics["shifted"] = len(self.positioned_nodes) - high
+        self.positioned_nodes[low:high] = replacement
+        return self.ast
+
+
+def full_parse(source):
+    return cursor_parser.parse(tokenize(source))
+
+
+def test_relex_damage():
+    print("test relex damage")
+    source = "{x = 1; y = 2}"
+    source, tokens, damage = relex(source, tokenize(source), 5, 1, "41")
+    assert source == "{x = 41; y = 2}"
+    assert tokens == tokenize(source)
+    assert damage == (3, 4, 4)
+    source, tokens, damage = relex(source, tokens, 1, 0, "print")
+    assert tokens == tokenize("{printx = 41; y = 2}")
+    assert damage == (1, 2, 2)
+    source, tokens, damage = relex(source, tokens, 0, 0, "  ")
+    assert tokens == tokenize("  {printx = 41; y = 2}")
+    assert damage == (0, 0, 0)
+
+
+def test_edit_reparses_enclosing_statement():
+    print("test edit reparses enclosing statement")
+    statements = [f"x{index} = {index}" for index in range(100)]
+    statements[50] = "while (i < 3) { i = i + 1; z = z + i }"
+    source = "{" + "; ".join(statements) + "}"
+    document = Document(source)
+    offset = source.index("z + i") + 4
+    document.edit(offset, 1, "(i * 2)")
+    assert document.source == source[:offset] + "(i * 2)" + source[offset + 1 :]
+    assert document.tokens == tokenize(document.source)
+    assert document.ast == full_parse(document.source)
+    assert document.statistics == {"changed": 5, "reparsed": 9, "shifted": 196}
+    document.edit(1, 0, "   ")
+    assert document.ast == full_parse(document.source)
+    assert document.statistics == {"changed": 0, "reparsed": 0, "shifted": 414}
+
+
+def test_edit_errors():
+    print("test edit errors")
+    document = Document("{x = 1; y = 2}")
+    for offset, deleted, inserted in [(6, 1, "@"), (6, 1, "")]:
+        try:
+            document.edit(offset, deleted, inserted)
+            assert False, "expected an exception for a broken source"
+        except Exception as e:
+            assert document.ast is None
+    document.edit(6, 0, ";")
+    assert document.source == "{x = 1; y = 2}"
+    assert document.ast == full_parse(document.source)
+
+
+def test_same_as_full_parse():
+    print("test same as full parse")
+    generator = random.Random(13)
+    fragments = ["x", "1", ".5", " ", ";", "+", "=", "(", ")", "{", "}", "if",
+                 "print", "printer", "<", "<=", "&&", "!", "y = 2;", "while(i) i = i-1;"]
+    for code in cursor_parser.sample_programs:
+        document = Document(code)
+        for _ in range(40):
+            offset = generator.randrange(len(document.source) + 1)
+            deleted = generator.randrange(min(3, len(document.source) - offset) + 1)
+            inserted = "".join(generator.sample(fragments, generator.randrange(3)))
+            source = document.source[:offset] + inserted + document.source[offset + deleted :]
+            try:
+                expected = full_parse(source)
+            except Exception:
+                expected = None
+            try:
+                ast = document.edit(offset, deleted, inserted)
+            except Exception:
+                ast = None
+            assert document.source == source
+            assert ast == expected, (code, source)
+            if expected is not None:
+                assert document.tokens == tokenize(source), source
+                assert document.positioned_nodes == positioned_nodes(document.ast), source
+            else:
+                # start again from a program that parses
+                document = Document(code)
+
+
+if __name__ == "__main__":
+    test_relex_damage()
+    test_edit_reparses_enclosing_statement()
+    test_edit_errors()
+    test_same_as_full_parse()
+    print("done.")
@@ -0,0 +1,171 @@
+"""
+instrument.py -- count and time the nodes evaluator.evaluate visits
+
+    profile = enable()          # from here on evaluate() is instrumented
+    evaluator.evaluate(ast, environment)
+    disable()
+    print(format_profile(profile))
+    text = to_json(profile)
+
+evaluate() reaches its children by calling the module global
+evaluator.evaluate, so enable() replaces that global with a wrapper and
+disable() puts the original back. Disabled, nothing is left in the path
+of evaluate(). Callers must look up evaluator.evaluate when they call it:
+a name imported with "from evaluator import evaluate" keeps the original
+and only its children are counted.
+
+The profile holds, for every tag, the number of visits, the inclusive time
+(the node and everything below it) and the exclusive time (the node
+alone). A node inside another node with the same tag, as in nested while
+loops, adds to the inclusive time only once, through the outermost one.
+The times include the cost of the wrapper itself, which is about that of
+a visit to a leaf.
+"""
+
+import json
+import time
+
+from tokenizer import tokenize
+from parser import parse
+import evaluator
+import output
+
+original_evaluate = evaluator.evaluate
+
+
+def enable(profile=None):
+    """
+    instrument evaluator.evaluate, adding to profile; returns the profile
+    """
+    if profile is None:
+        profile = {}
+    clock = time.perf_counter
+    children = [0.0]  # time spent in the children of each active node
+    active = {}  # tag -> number of active nodes with that tag
+
+    def evaluate(ast, environment):
+        tag = ast["tag"]
+        active[tag] = active.get(tag, 0) + 1
+        children.append(0.0)
+        start = clock()
+        try:
+            return original_evaluate(ast, environment)
+        finally:
+            elapsed = clock() - start
+            child = children.pop()
+            children[-1] = children[-1] + elapsed
+            active[tag] = active[tag] - 1
+            entry = profile.get(tag)
+            if entry is None:
+                entry = profile[tag] = {"count": 0, "inclusive": 0.0, "exclusive": 0.0}
+            entry["count"] = entry["count"] + 1
+            if not active[tag]:
+                entry["inclusive"] = entry["inclusive"] + elapsed
+            entry["exclusive"] = entry["exclusive"] + elapsed - child
+
+    evaluator.evaluate = evaluate
+    return profile
+
+
+def disable():
+    evaluator.evaluate = original_evaluate
+
+
+def enabled():
+    return evaluator.evaluate is not original_evaluate
+
+
+def to_json(profile):
+    return json.dumps(profile, indent=2, sort_keys=True)
+
+
+def format_profile(profile):
+    """
+    one line per tag, the most exclusive time first
+    """
+    lines = [f"{'tag':<12} {'count':>10} {'inclusive ms':>14} {'exclusive ms':>14}"]
+    for tag, entry in sorted(profile.items(), key=lambda item: -item[1]["exclusive"]):
+        lines.append(
+            f"{tag:<12} {entry['count']:>10} "
+            f"{entry['inclusive'] * 1000:>14.3f} {entry['exclusive'] * 1000:>14.3f}"
+        )
+    return "\n".join(lines)
+
+
+def test_counts():
+    print("test counts")
+    ast = parse(tokenize("{x=3; y=0; while (x>0) {x=x-1;y=y+x}; print(y)}"))
+    profile = enable()
+    try:
+        environment = {}
+        with output.redirect(output.ListSink()) as printed:
+            assert evaluator.evaluate(ast, environment) == (None, False)
+    finally:
+        disable()
+    assert environment == {"x": 0, "y": 3}
+    assert printed.getvalue() == "3 \n"
+    counts = {tag: entry["count"] for tag, entry in profile.items()}
+    assert counts == {
+        "block": 10,
+        "=": 8,
+        "number": 9,
+        "while": 1,
+        ">": 4,
+        "identifier": 14,
+        "-": 3,
+        "+": 3,
+        "print": 1,
+    }
+    # the block around the whole program includes all the time
+    total = profile["block"]["inclusive"]
+    assert abs(sum(entry["exclusive"] for entry in profile.values()) - total) < 1e-3
+    for entry in profile.values():
+        assert 0 <= entry["exclusive"] <= entry["inclusive"] <= total
+
+
+def test_disabled():
+    print("test disabled")
+    assert not enabled()
+    profile = enable()
+    assert enabled()
+    disable()
+    assert evaluator.evaluate is original_evaluate
+    evaluator.evaluate(parse(tokenize("1 + 2")), {})
+    assert profile == {}
+
+
+def test_errors_still_counted():
+    print("test errors still counted")
+    profile = enable()
+    try:
+        evaluator.evaluate(parse(tokenize("x = 1/0")), {})
+        assert False, "expected ZeroDivisionError"
+    except ZeroDivisionError:
+        pass
+    finally:
+        disable()
+    assert profile["/"]["count"] == 1 and profile["="]["count"] == 1
+
+
+def test_json():
+    print("test json")
+    profile = enable()
+    try:
+        evaluator.evaluate(parse(tokenize("{x=1; x+2}")), {})
+    finally:
+        disable()
+    exported = json.loads(to_json(profile))
+    assert exported.keys() == profile.keys()
+    assert exported["+"]["count"] == 1
+    assert format_profile(profile).splitlines()[0].split() == [
+        "tag", "count", "inclusive", "ms", "exclusive", "ms"
+    ]
+    assert len(format_profile(profile).splitlines()) == len(profile) + 1
+
+
+if __name__ == "__main__":
+    test_counts()
+    test_disabled()
+    test_errors_still_counted()
+    test_json()
+    print("done.")
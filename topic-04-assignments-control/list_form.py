@@ -0,0 +1,191 @@
+"""
+list_form.py -- ASTs whose blocks and argument lists are Python lists
+
+The parsers link the statements of a block through "next":
+
+    {"tag": "block", "statement": S1, "next": {"tag": "block", "statement": S2}}
+
+and the arguments of a print statement the same way. Evaluating the linked
+form recurses once per statement, so a long block runs out of Python stack.
+In the list form the children are held in a list and evaluated in a loop:
+
+    {"tag": "block", "statements": [S1, S2]}
+    {"tag": "print", "arguments": [A1, A2]}
+
+Every evaluator and compiler accepts both forms.
+
+    ast = to_list_form(parse(tokenize(code)))
+    ast = parse(tokens)                      # the same, in one step
+"""
+
+import sys
+
+from tokenizer import tokenize, tokenize_single_pass
+import cursor_parser
+import evaluator
+import dispatch_evaluator
+import compiler
+import bytecode
+import resolver
+import optimizer
+
+
+def to_list_form(ast):
+    """
+    a copy of a linked-form AST in list form; the copy is made with an
+    explicit stack, so any AST the parsers build can be converted
+    """
+    root = {}
+    pending = [(ast, root)]
+    while pending:
+        node, copy = pending.pop()
+        tag = node["tag"]
+        if tag == "block":
+            copy["tag"] = "block"
+            copy["statements"] = []
+            if "position" in node:
+                copy["position"] = node["position"]
+            cell = node
+            while cell:
+                if "statement" in cell:
+                    child = {}
+                    copy["statements"].append(child)
+                    pending.append((cell["statement"], child))
+                cell = cell.get("next", None)
+            continue
+        for key, value in node.items():
+            if key == "next":
+                # followed by the owner of the chain
+                continue
+            if tag == "print" and key == "arguments":
+                copy["arguments"] = []
+                while value:
+                    child = {}
+                    copy["arguments"].append(child)
+                    pending.append((value, child))
+                    value = value.get("next", None)
+            elif type(value) is dict:
+                copy[key] = {}
+                pending.append((value, copy[key]))
+            else:
+                copy[key] = value
+    return root
+
+
+def to_linked_form(ast):
+    """
+    a copy of a list-form AST in the linked form the parsers build
+    """
+    root = {}
+    pending = [(ast, root)]
+    while pending:
+        node, copy = pending.pop()
+        tag = node["tag"]
+        if tag == "block":
+            cell = copy
+            cell["tag"] = "block"
+            if "position" in node:
+                cell["position"] = node["position"]
+            for index, statement in enumerate(node["statements"]):
+                if index > 0:
+                    # positioned at its statement, as the parsers do
+                    cell["next"] = {"tag": "block"}
+                    if "position" in statement:
+                        cell["next"]["position"] = statement["position"]
+                    cell = cell["next"]
+                cell["statement"] = {}
+                pending.append((statement, cell["statement"]))
+            continue
+        for key, value in node.items():
+            if tag == "print" and key == "arguments":
+                copy["arguments"] = None
+                previous = None
+                for argument in value:
+                    child = {}
+                    if previous is None:
+                        copy["arguments"] = child
+                    else:
+                        previous["next"] = child
+                    pending.append((argument, child))
+                    previous = child
+            elif type(value) is dict:
+                copy[key] = {}
+                pending.append((value, copy[key]))
+            else:
+                copy[key] = value
+    return root
+
+
+def parse(tokens):
+    return to_list_form(cursor_parser.parse(tokens))
+
+
+def long_block(statements):
+    return "{" + "; ".join(f"x{index % 10} = {index}" for index in range(statements)) + "}"
+
+
+def test_round_trip():
+    print("test round trip")
+    for code in cursor_parser.sample_programs:
+        ast = cursor_parser.parse(tokenize(code))
+        assert to_linked_form(to_list_form(ast)) == ast, code
+    assert parse(tokenize("{x=1; print(x, 2); {}}")) == {
+        "tag": "block",
+        "statements": [
+            {
+                "tag": "=",
+                "target": {"tag": "identifier", "value": "x", "position": 1},
+                "value": {"tag": "number", "value": 1, "position": 3},
+                "position": 2,
+            },
+            {
+                "tag": "print",
+                "arguments": [
+                    {"tag": "identifier", "value": "x", "position": 12},
+                    {"tag": "number", "value": 2, "position": 15},
+                ],
+                "position": 6,
+            },
+            {"tag": "block", "statements": [], "position": 19},
+        ],
+        "position": 0,
+    }
+    assert parse(tokenize("print()")) == {"tag": "print", "arguments": [], "position": 0}
+
+
+def test_same_as_evaluator():
+    print("test same as evaluator")
+    for run in [
+        evaluator.evaluate,
+        dispatch_evaluator.evaluate,
+        lambda ast, environment: compiler.compile_program(ast)(environment),
+        lambda ast, environment: bytecode.run(bytecode.compile_program(ast), environment),
+        resolver.run,
+        lambda ast, environment: evaluator.evaluate(optimizer.optimize(ast)[0], environment),
+    ]:
+        evaluator.assert_same_as_evaluator(
+            lambda ast, environment: run(to_list_form(ast), environment)
+        )
+
+
+def test_long_blocks():
+    print("test long blocks")
+    tokens = tokenize_single_pass(long_block(5 * sys.getrecursionlimit()))
+    linked = cursor_parser.parse(tokens)
+    ast = to_list_form(linked)
+    for run in [evaluator.evaluate, dispatch_evaluator.evaluate, resolver.run]:
+        environment = {}
+        assert run(ast, environment) == (None, False)
+        assert environment["x9"] == 5 * sys.getrecursionlimit() - 1
+    try:
+        evaluator.evaluate(linked, {})
+        assert False, "expected the linked form to run out of stack"
+    except RecursionError:
+        pass
+
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_same_as_evaluator()
+    test_long_blocks()
+    print("done.")
@@ -0,0 +1,291 @@
+"""
+optimizer.py -- simplify an AST before it is evaluated
+
+    ast, report = optimize(parse(tokenize(code)))
+    print(format_report(report))
+
+Passes, in order:
+
+    collapse unary chains   - -(x+1) => x+1,  ! ! ! x => ! x
+    fold constants          2*3+x => 6+x,  1 < 2 => 1,  !0 => 1,  0 && x => 0
+    remove dead branches    if(1) S else T => S,  if(0) S else T => T,
+                            and if(0) S or while(0) S dropped from a block
+
+The passes return a new AST and leave the one they are given untouched.
+Division by zero is never folded, so it still fails when the program runs.
+A dead statement is only dropped when another statement follows it in its
+block, since the last statement of a block provides the block's value.
+"""
+
+from tokenizer import tokenize
+from parser import parse
+import compiler
+import evaluator
+
+
+def count_nodes(ast):
+    count = 0
+    pending = [ast]
+    while pending:
+        node = pending.pop()
+        count = count + 1
+        for value in node.values():
+            if type(value) is dict:
+                pending.append(value)
+            elif type(value) is list:
+                pending.extend(value)
+    return count
+
+
+def transform(ast, rewrite):
+    """
+    copy ast bottom-up, passing each copied node through rewrite; a
+    replacement for a node in an argument list keeps the node's "next"
+    """
+    node = {}
+    for key, value in ast.items():
+        if type(value) is dict:
+            value = transform(value, rewrite)
+        elif type(value) is list:
+            value = [transform(item, rewrite) for item in value]
+        node[key] = value
+    new_node = rewrite(node)
+    if new_node is not node and "next" in node and node["tag"] != "block":
+        new_node = dict(new_node, next=node["next"])
+    return new_node
+
+
+def is_number(ast):
+    return ast["tag"] == "number"
+
+
+def number(value, ast):
+    """
+    a number node for a folded value, at the position of the node it replaces
+    """
+    node = {"tag": "number", "value": value}
+    if "position" in ast:
+        node["position"] = ast["position"]
+    return node
+
+
+def is_numeric(ast):
+    """
+    whether the value of ast is always a number; - -x is x only for numbers,
+    as -None fails and - -True is 1
+    """
+    tag = ast["tag"]
+    return tag in ["number", "negate", "not", "&&", "||"] or tag in compiler.binary_operators
+
+
+def collapse_unary(node):
+    tag = node["tag"]
+    if tag == "negate" and node["value"]["tag"] == "negate":
+        if is_numeric(node["value"]["value"]):
+            return node["value"]["value"]
+    if tag == "not" and node["value"]["tag"] == "not":
+        if node["value"]["value"]["tag"] == "not":
+            return node["value"]["value"]
+    return node
+
+
+def fold_constants(node):
+    tag = node["tag"]
+    if tag == "negate" and is_number(node["value"]):
+        return number(-node["value"]["value"], node)
+    if tag == "not" and is_number(node["value"]):
+        return number(0 if node["value"]["value"] else 1, node)
+    if tag in ["&&", "||"] and is_number(node["left"]):
+        # the right operand is never evaluated when the left one decides
+        if bool(node["left"]["value"]) == (tag == "||"):
+            return number(int(node["left"]["value"]), node)
+    if tag in compiler.binary_operators:
+        left, right = node["left"], node["right"]
+        if is_number(left) and is_number(right):
+            if tag == "/" and right["value"] == 0:
+                return node
+            operation = compiler.binary_operators[tag]
+            return number(operation(left["value"], right["value"]), node)
+    return node
+
+
+def is_dead(node):
+    """
+    a statement that does nothing and whose value is None
+    """
+    if node["tag"] in ["if", "while"] and is_number(node["condition"]):
+        if not node["condition"]["value"]:
+            return node["tag"] == "while" or not node.get("else", None)
+    return False
+
+
+def remove_dead_branches(node):
+    tag = node["tag"]
+    if tag == "if" and is_number(node["condition"]):
+        if node["condition"]["value"]:
+            return node["then"]
+        if node.get("else", None):
+            return node["else"]
+    if tag == "block" and node.get("next") and is_dead(node["statement"]):
+        return node["next"]
+    if tag == "block" and "statements" in node:
+        statements = node["statements"]
+        kept = [statement for statement in statements[:-1] if not is_dead(statement)]
+        return dict(node, statements=kept + statements[-1:])
+    return node
+
+
+passes = [
+    ["collapse unary chains", collapse_unary],
+    ["fold constants", fold_constants],
+    ["remove dead branches", remove_dead_branches],
+]
+
+
+def optimize(ast):
+    """
+    optimized copy of ast, and a report of the node count before and after each pass
+    """
+    report = []
+    for name, rewrite in passes:
+        before = count_nodes(ast)
+        ast = transform(ast, rewrite)
+        report.append({"pass": name, "before": before, "after": count_nodes(ast)})
+    return ast, report
+
+
+def format_report(report):
+    lines = []
+    for entry in report:
+        removed = entry["before"] - entry["after"]
+        lines.append(
+            f"{entry['pass']:<24} {entry['before']:>6} -> {entry['after']:>6} nodes"
+            f"  ({removed} removed)"
+        )
+    return "\n".join(lines)
+
+
+def without_positions(ast):
+    if type(ast) is list:
+        return [without_positions(item) for item in ast]
+    return {
+        key: without_positions(value) if type(value) in [dict, list] else value
+        for key, value in ast.items()
+        if key != "position"
+    }
+
+
+def optimized(code):
+    ast, _ = optimize(parse(tokenize(code)))
+    return without_positions(ast)
+
+
+def test_collapse_unary_chains():
+    print("test collapse unary chains")
+    assert optimized("--(x+1)") == optimized("x+1")
+    assert optimized("---x") == optimized("-x")
+    assert optimized("--(x < 1)") == optimized("x < 1")
+    assert optimized("--x") == {
+        "tag": "negate",
+        "value": {"tag": "negate", "value": {"tag": "identifier", "value": "x"}},
+    }
+    assert optimized("!!!x") == optimized("!x")
+    assert optimized("!!x") == {
+        "tag": "not",
+        "value": {"tag": "not", "value": {"tag": "identifier", "value": "x"}},
+    }
+
+
+def test_fold_constants():
+    print("test fold constants")
+    assert optimized("2*3+x") == optimized("6+x")
+    assert optimized("--5") == {"tag": "number", "value": 5}
+    assert optimized("1 < 2 && 3 != 3") == {"tag": "number", "value": 0}
+    assert optimized("!0") == {"tag": "number", "value": 1}
+    assert optimized("0 && x") == {"tag": "number", "value": 0}
+    assert optimized("2 || x") == {"tag": "number", "value": 2}
+    assert optimized("1 && x")["tag"] == "&&"
+    assert optimized("1.5 * 2") == {"tag": "number", "value": 3.0}
+    assert optimized("x = 2*3") == optimized("x = 6")
+    assert optimized("print(2*3, x)") == optimized("print(6, x)")
+    assert optimized("1/0")["tag"] == "/"
+
+
+def test_remove_dead_branches():
+    print("test remove dead branches")
+    assert optimized("if(1) x=1 else x=2") == optimized("x=1")
+    assert optimized("if(2-2) x=1 else x=2") == optimized("x=2")
+    assert optimized("{if(0) x=1; while(0) x=2; y=1}") == optimized("{y=1}")
+    assert optimized("{y=1; if(0) x=1}") == optimized("{y=1; if(0) x=1}")
+    assert optimized("while(1-1) x=1")["tag"] == "while"
+
+
+def test_list_form():
+    print("test list form")
+    import list_form
+
+    ast, _ = optimize(list_form.parse(tokenize("{if(0) x=1; print(2*3, 1); y=1; if(0) y=2}")))
+    assert without_positions(ast) == without_positions(
+        list_form.parse(tokenize("{print(6, 1); y=1; if(0) y=2}"))
+    )
+
+
+def test_report():
+    print("test report")
+    ast, report = optimize(parse(tokenize("{if(1-1) x=1; y = --(2*3)}")))
+    assert [entry["pass"] for entry in report] == [name for name, _ in passes]
+    assert report[0] == {"pass": "collapse unary chains", "before": 16, "after": 14}
+    assert report[1] == {"pass": "fold constants", "before": 14, "after": 10}
+    assert report[2] == {"pass": "remove dead branches", "before": 10, "after": 4}
+    assert "6 removed" in format_report(report)
+    assert without_positions(ast) == optimized("{y = 6}")
+
+
+def test_input_is_not_changed():
+    print("test input is not changed")
+    ast = parse(tokenize("{x = 2*3; if(0) y = 1; z = 1}"))
+    before = repr(ast)
+    optimize(ast)
+    assert repr(ast) == before
+
+
+def test_double_negation():
+    print("test double negation")
+    for code, environment in [
+        ("--x", {}),
+        ("--x", {"x": True}),
+        ("--x", {"x": 2.5}),
+        ("--(x * 2)", {"x": True}),
+        ("---x", {"x": True}),
+        ("--(!x)", {"x": None}),
+    ]:
+        results = []
+        for ast in [parse(tokenize(code)), optimize(parse(tokenize(code)))[0]]:
+            try:
+                value = evaluator.evaluate(ast, dict(environment))[0]
+                results.append((type(value), value))
+            except Exception as e:
+                results.append((type(e), str(e)))
+        assert results[0] == results[1], (code, environment, results)
+
+
+def test_same_as_evaluator():
+    print("test same as evaluator")
+
+    def evaluate(ast, environment):
+        ast, _ = optimize(ast)
+        return evaluator.evaluate(ast, environment)
+
+    evaluator.assert_same_as_evaluator(evaluate)
+
+
+if __name__ == "__main__":
+    test_collapse_unary_chains()
+    test_fold_constants()
+    test_remove_dead_branches()
+    test_list_form()
+    test_report()
+    test_input_is_not_changed()
+    test_double_negation()
+    test_same_as_evaluator()
+    print("done.")
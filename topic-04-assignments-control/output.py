@@ -0,0 +1,195 @@
+"""
+output.py -- where print statements write
+
+Every evaluator writes the output of print statements with output.write(),
+which hands it to the current sink:
+
+    StreamSink()                      straight through to sys.stdout (the default)
+    StreamSink(stream, 65536)         to stream, in writes of about 64k characters
+    ListSink()                        kept in memory, sink.getvalue() gives it back
+    NullSink()                        dropped, for timing the evaluators alone
+
+    previous = set_output(StreamSink(sys.stdout, 65536))
+    ...
+    flush()                           at the end of the program
+
+    with redirect(ListSink()) as sink:
+        evaluate(ast, environment)
+    text = sink.getvalue()
+
+A buffered sink only writes once its buffer reaches buffer_size characters,
+so whoever installs one must flush it when the program ends; set_output()
+and redirect() flush the sink they replace.
+"""
+
+import contextlib
+import io
+import sys
+
+from tokenizer import tokenize
+from parser import parse
+
+
+class StreamSink:
+    def __init__(self, stream=None, buffer_size=0):
+        # stream None writes to whatever sys.stdout is at the time, so
+        # contextlib.redirect_stdout() still captures the output
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.pieces = []
+        self.size = 0
+
+    def write(self, text):
+        if self.buffer_size == 0:
+            (self.stream or sys.stdout).write(text)
+            return
+        self.pieces.append(text)
+        self.size = self.size + len(text)
+        if self.size >= self.buffer_size:
+            self.write_buffer()
+
+    def write_buffer(self):
+        if self.pieces:
+            (self.stream or sys.stdout).write("".join(self.pieces))
+            self.pieces = []
+            self.size = 0
+
+    def flush(self):
+        self.write_buffer()
+        (self.stream or sys.stdout).flush()
+
+
+class ListSink:
+    def __init__(self):
+        self.pieces = []
+
+    def write(self, text):
+        self.pieces.append(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return "".join(self.pieces)
+
+
+class NullSink:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+sink = StreamSink()
+
+
+def write(text):
+    sink.write(text)
+
+
+def flush():
+    sink.flush()
+
+
+def set_output(new_sink):
+    """
+    make new_sink the current sink, returning the one it replaces
+    """
+    global sink
+    previous = sink
+    previous.flush()
+    sink = new_sink
+    return previous
+
+
+@contextlib.contextmanager
+def redirect(new_sink):
+    previous = set_output(new_sink)
+    try:
+        yield new_sink
+    finally:
+        set_output(previous)
+
+
+def evaluators():
+    """
+    (name, run) for every evaluator, run taking an AST and an environment
+    """
+    import evaluator
+    import dispatch_evaluator
+    import stack_evaluator
+    import compiler
+    import bytecode
+    import resolver
+
+    return [
+        ("evaluator", evaluator.evaluate),
+        ("dispatch_evaluator", dispatch_evaluator.evaluate),
+        ("stack_evaluator", stack_evaluator.evaluate),
+        ("compiler", lambda ast, environment: compiler.compile_program(ast)(environment)),
+        (
+            "bytecode",
+            lambda ast, environment: bytecode.run(bytecode.compile_program(ast), environment),
+        ),
+        ("resolver", resolver.run),
+    ]
+
+
+def test_list_sink():
+    print("test list sink")
+    # the evaluators write through the imported module, which is not this
+    # one when this file is run as a script
+    import output
+
+    code = "{x=3; while (x>0) {print(x, x*1.5); x=x-1}; print()}"
+    for name, run in evaluators():
+        with output.redirect(output.ListSink()) as captured:
+            run(parse(tokenize(code)), {})
+        assert captured.getvalue() == "3 4.5 \n2 3.0 \n1 1.5 \n\n", name
+
+
+def test_stream_sink():
+    print("test stream sink")
+    stream = io.StringIO()
+    writes = []
+    stream.write = lambda text, write=stream.write: writes.append(text) or write(text)
+    buffered = StreamSink(stream, buffer_size=10)
+    for text in ["1 ", "2 ", "\n", "333333 ", "4 ", "\n", "5 "]:
+        buffered.write(text)
+    assert writes == ["1 2 \n333333 "]
+    buffered.flush()
+    assert writes == ["1 2 \n333333 ", "4 \n5 "]
+    assert stream.getvalue() == "1 2 \n333333 4 \n5 "
+    # unbuffered, to sys.stdout as it is at each write
+    captured = io.StringIO()
+    with contextlib.redirect_stdout(captured):
+        StreamSink().write("x ")
+    assert captured.getvalue() == "x "
+
+
+def test_set_output():
+    print("test set output")
+    import output
+
+    stream = io.StringIO()
+    previous = output.set_output(output.StreamSink(stream, buffer_size=1000))
+    try:
+        output.write("1 ")
+        assert stream.getvalue() == ""
+        with output.redirect(output.NullSink()):
+            output.write("2 ")
+        # the buffered sink was flushed when it was replaced
+        assert stream.getvalue() == "1 "
+        output.write("3 ")
+    finally:
+        output.set_output(previous)
+    assert stream.getvalue() == "1 3 "
+    assert output.sink is previous
+
+
+if __name__ == "__main__":
+    test_list_sink()
+    test_stream_sink()
+    test_set_output()
+    print("done.")
@@ -2,6 +2,11 @@
 parser.py -- implement simple parser for PMDAS expressions
 
 Accept a string of tokens, return an AST expressed as a stack of dictionaries
+
+Every node has the position of the token it was built from: the operator
+of an operator node, the keyword of a statement and the "{" of a block. A
+block cell after the first has no token of its own and has the position
+of its statement.
 """
 
 """
@@ -38,8 +43,9 @@ def parse_simple_expression(tokens):
         assert tokens[0]["tag"] == ")", "Error: expected ')'"
         return node, tokens[1:]
     if tokens[0]["tag"] == "-":
+        position = tokens[0]["position"]
         new_node, tokens = parse_simple_expression(tokens[1:])
-        node = {"tag": "negate", "value": new_node}
+        node = {"tag": "negate", "value": new_node, "position": position}
         return node, tokens
     return node, tokens
 
@@ -59,6 +65,7 @@ def test_parse_simple_expression():
     assert ast == {
         "tag": "negate",
         "value": {"tag": "number", "value": 2, "position": 1},
+        "position": 0,
     }
     tokens = tokenize("x")
     ast, tokens = parse_simple_expression(tokens)
@@ -90,9 +97,9 @@ def parse_term(tokens):
     """
     node, tokens = parse_factor(tokens)
     while tokens[0]["tag"] in ["*", "/"]:
-        operator = tokens[0]["tag"]
+        operator, position = tokens[0]["tag"], tokens[0]["position"]
         new_node, tokens = parse_factor(tokens[1:])
-        node = {"tag": operator, "left": node, "right": new_node}
+        node = {"tag": operator, "left": node, "right": new_node, "position": position}
     return node, tokens
 
 
@@ -110,6 +117,7 @@ def test_parse_term():
         "tag": "*",
         "left": {"tag": "number", "value": 2, "position": 0},
         "right": {"tag": "number", "value": 2, "position": 2},
+        "position": 1,
     }
 
 
@@ -119,9 +127,9 @@ def parse_math_expression(tokens):
     """
     node, tokens = parse_term(tokens)
     while tokens[0]["tag"] in ["+", "-"]:
-        operator = tokens[0]["tag"]
+        operator, position = tokens[0]["tag"], tokens[0]["position"]
         new_node, tokens = parse_term(tokens[1:])
-        node = {"tag": operator, "left": node, "right": new_node}
+        node = {"tag": operator, "left": node, "right": new_node, "position": position}
     return node, tokens
 
 
@@ -137,6 +145,7 @@ def test_parse_math_expression():
         "tag": "+",
         "left": {"tag": "number", "value": 2, "position": 0},
         "right": {"tag": "number", "value": 3, "position": 2},
+        "position": 1,
     }
     ast, tokens = parse_math_expression(tokenize("1+2+3"))
     assert ast == {
@@ -145,8 +154,10 @@ def test_parse_math_expression():
             "tag": "+",
             "left": {"tag": "number", "value": 1, "position": 0},
             "right": {"tag": "number", "value": 2, "position": 2},
+            "position": 1,
         },
         "right": {"tag": "number", "value": 3, "position": 4},
+        "position": 3,
     }
     ast, tokens = parse_math_expression(tokenize("x+y+z"))
     assert ast == {
@@ -155,14 +166,17 @@ def test_parse_math_expression():
             "tag": "+",
             "left": {"tag": "identifier", "value": "x", "position": 0},
             "right": {"tag": "identifier", "value": "y", "position": 2},
+            "position": 1,
         },
         "right": {"tag": "identifier", "value": "z", "position": 4},
+        "position": 3,
     }
     ast, tokens = parse_math_expression(tokenize("3-2"))
     assert ast == {
         "tag": "-",
         "left": {"tag": "number", "value": 3, "position": 0},
         "right": {"tag": "number", "value": 2, "position": 2},
+        "position": 1,
     }
     ast, tokens = parse_math_expression(tokenize("1+2*3"))
     assert ast == {
@@ -172,7 +186,9 @@ def test_parse_math_expression():
             "tag": "*",
             "left": {"tag": "number", "value": 2, "position": 2},
             "right": {"tag": "number", "value": 3, "position": 4},
+            "position": 3,
         },
+        "position": 1,
     }
     ast, tokens = parse_math_expression(tokenize("(1+2)*3"))
     assert ast == {
@@ -181,8 +197,10 @@ def test_parse_math_expression():
             "tag": "+",
             "left": {"tag": "number", "value": 1, "position": 1},
             "right": {"tag": "number", "value": 2, "position": 3},
+            "position": 2,
         },
         "right": {"tag": "number", "value": 3, "position": 6},
+        "position": 5,
     }
     ast, tokens = parse_math_expression(tokenize("-(1+2)*-3"))
     assert ast == {
@@ -193,12 +211,16 @@ def test_parse_math_expression():
                 "tag": "+",
                 "left": {"tag": "number", "value": 1, "position": 2},
                 "right": {"tag": "number", "value": 2, "position": 4},
+                "position": 3,
             },
+            "position": 0,
         },
         "right": {
             "tag": "negate",
             "value": {"tag": "number", "value": 3, "position": 8},
+            "position": 7,
         },
+        "position": 6,
     }
 
 
@@ -208,9 +230,9 @@ def parse_relational_expression(tokens):
     """
     node, tokens = parse_math_expression(tokens)
     while tokens[0]["tag"] in ["<", ">", "<=", ">=", "==", "!="]:
-        tag = tokens[0]["tag"]
+        tag, position = tokens[0]["tag"], tokens[0]["position"]
         next_node, tokens = parse_math_expression(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
+        node = {"tag": tag, "left": node, "right": next_node, "position": position}
     return node, tokens
 
 
@@ -221,7 +243,7 @@ def parse_logical_factor(tokens):
     token = tokens[0]
     if token["tag"] == "!":
         node, tokens = parse_logical_factor(tokens[1:])
-        return {"tag": "not", "value": node}, tokens
+        return {"tag": "not", "value": node, "position": token["position"]}, tokens
     return parse_relational_expression(tokens)
 
 
@@ -231,9 +253,9 @@ def parse_logical_term(tokens):
     """
     node, tokens = parse_logical_factor(tokens)
     while tokens[0]["tag"] == "&&":
-        tag = tokens[0]["tag"]
+        tag, position = tokens[0]["tag"], tokens[0]["position"]
         next_node, tokens = parse_logical_factor(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
+        node = {"tag": tag, "left": node, "right": next_node, "position": position}
     return node, tokens
 
 
@@ -243,9 +265,9 @@ def parse_logical_expression(tokens):
     """
     node, tokens = parse_logical_term(tokens)
     while tokens[0]["tag"] == "||":
-        tag = tokens[0]["tag"]
+        tag, position = tokens[0]["tag"], tokens[0]["position"]
         next_node, tokens = parse_logical_term(tokens[1:])
-        node = {"tag": tag, "left": node, "right": next_node}
+        node = {"tag": tag, "left": node, "right": next_node, "position": position}
     return node, tokens
 
 
@@ -255,9 +277,9 @@ def parse_expression(tokens):
     """
     ast, tokens = parse_logical_expression(tokens)
     if tokens[0]["tag"] == "=":
-        operator = tokens[0]["tag"]
+        operator, position = tokens[0]["tag"], tokens[0]["position"]
         value_ast, tokens = parse_math_expression(tokens[1:])
-        ast = {"tag": operator, "target": ast, "value": value_ast}
+        ast = {"tag": operator, "target": ast, "value": value_ast, "position": position}
     return ast, tokens
 
 
@@ -289,12 +311,16 @@ def test_parse_expression():
                     "tag": "+",
                     "left": {"tag": "identifier", "value": "i", "position": 0},
                     "right": {"tag": "number", "value": 2, "position": 2},
+                    "position": 1,
                 },
                 "right": {"tag": "number", "value": 3, "position": 4},
+                "position": 3,
             },
             "right": {"tag": "number", "value": 4, "position": 6},
+            "position": 5,
         },
         "value": {"tag": "identifier", "value": "i", "position": 8},
+        "position": 7,
     }
 
 
@@ -342,6 +368,7 @@ def parse_if_statement(tokens):
     if_statement = "if" "(" expression ")" statement [ "else" statement ];
     """
     assert tokens[0]["tag"] == "if"
+    position = tokens[0]["position"]
     tokens = tokens[1:]
     assert tokens[0]["tag"] == "("
     tokens = tokens[1:]
@@ -349,7 +376,7 @@ def parse_if_statement(tokens):
     assert tokens[0]["tag"] == ")"
     tokens = tokens[1:]
     then_statement, tokens = parse_statement(tokens)
-    node = {"tag": "if", "condition": condition, "then": then_statement}
+    node = {"tag": "if", "condition": condition, "then": then_statement, "position": position}
     if tokens[0]["tag"] == "else":
         tokens = tokens[1:]
         else_statement, tokens = parse_statement(tokens)
@@ -368,7 +395,9 @@ def test_parse_if_statement():
         "then": {
             "tag": "print",
             "arguments": {"tag": "number", "value": 1, "position": 11},
+            "position": 5,
         },
+        "position": 0,
     }
     ast, tokens = parse_if_statement(tokenize("if(1) print(1) else print(2)"))
     assert ast == {
@@ -377,11 +406,14 @@ def test_parse_if_statement():
         "then": {
             "tag": "print",
             "arguments": {"tag": "number", "value": 1, "position": 12},
+            "position": 6,
         },
         "else": {
             "tag": "print",
             "arguments": {"tag": "number", "value": 2, "position": 26},
+            "position": 20,
         },
+        "position": 0,
     }
 
 
@@ -390,6 +422,7 @@ def parse_while_statement(tokens):
     while_statement = "while" "(" expression ")" statement;
     """
     assert tokens[0]["tag"] == "while"
+    position = tokens[0]["position"]
     tokens = tokens[1:]
     assert tokens[0]["tag"] == "("
     tokens = tokens[1:]
@@ -397,7 +430,7 @@ def parse_while_statement(tokens):
     assert tokens[0]["tag"] == ")"
     tokens = tokens[1:]
     do_statement, tokens = parse_statement(tokens)
-    node = {"tag": "while", "condition": condition, "do": do_statement}
+    node = {"tag": "while", "condition": condition, "do": do_statement, "position": position}
     return node, tokens
 
 
@@ -412,7 +445,9 @@ def test_parse_while_statement():
         "do": {
             "tag": "print",
             "arguments": {"tag": "number", "value": 1, "position": 14},
+            "position": 8,
         },
+        "position": 0,
     }
 
 
@@ -421,9 +456,10 @@ def parse_print_statement(tokens):
     print_statement = "print" expression_list
     """
     assert tokens[0]["tag"] == "print"
+    position = tokens[0]["position"]
     tokens = tokens[1:]
     arguments, tokens = parse_expression_list(tokens)
-    return {"tag": "print", "arguments": arguments}, tokens
+    return {"tag": "print", "arguments": arguments, "position": position}, tokens
 
 
 def test_parse_print_statement():
@@ -431,6 +467,7 @@ def test_parse_print_statement():
     assert ast == {
         "tag": "print",
         "arguments": {"tag": "number", "value": 4, "position": 6},
+        "position": 0,
     }
     ast, tokens = parse_print_statement(tokenize("print(1,2,3)"))
     assert ast == {
@@ -446,6 +483,7 @@ def test_parse_print_statement():
                 "next": {"tag": "number", "value": 3, "position": 10},
             },
         },
+        "position": 0,
     }
 
 
@@ -454,8 +492,8 @@ def parse_block_statement(tokens):
     block_statement = "{" {";"} [ statement { ";" {";"} statement } {";"} ] "}";
     """
     assert tokens[0]["tag"] == "{"
+    node = {"tag": "block", "position": tokens[0]["position"]}
     tokens = tokens[1:]
-    node = {"tag": "block"}
     first_node = node
     while tokens[0]["tag"] == ";":
         tokens = tokens[1:]
@@ -467,7 +505,13 @@ def parse_block_statement(tokens):
                 tokens = tokens[1:]
             if tokens[0]["tag"] != "}":
                 statement, tokens = parse_statement(tokens)
-                node["next"] = {"tag": "block", "statement": statement}
+                # a continuation has no token of its own, it takes the
+                # position of its statement
+                node["next"] = {
+                    "tag": "block",
+                    "statement": statement,
+                    "position": statement["position"],
+                }
                 node = node["next"]
             assert tokens[0]["tag"] in [";", "}"]
     assert tokens[0]["tag"] == "}"
@@ -496,7 +540,9 @@ def test_parse_block_statement():
                 "tag": "=",
                 "target": {"tag": "identifier", "value": "x", "position": 0},
                 "value": {"tag": "number", "value": 1, "position": 0},
+                "position": 0,
             },
+            "position": 0,
         }
     for code in ["{x=1;y=2}", "{x=1;y=2;}", "{x=1;;y=2;}", "{;x=1;;y=2;}"]:
         ast = parse_block_statement(tokenize(code))[0]
@@ -507,6 +553,7 @@ def test_parse_block_statement():
                 "tag": "=",
                 "target": {"tag": "identifier", "value": "x", "position": 0},
                 "value": {"tag": "number", "value": 1, "position": 0},
+                "position": 0,
             },
             "next": {
                 "tag": "block",
@@ -514,8 +561,11 @@ def test_parse_block_statement():
                     "tag": "=",
                     "target": {"tag": "identifier", "value": "y", "position": 0},
                     "value": {"tag": "number", "value": 2, "position": 0},
+                    "position": 0,
                 },
+                "position": 0,
             },
+            "position": 0,
         }
 
     ast = parse_block_statement(tokenize("{x=1;y=2;z=3}"))[0]
@@ -526,6 +576,7 @@ def test_parse_block_statement():
             "tag": "=",
             "target": {"tag": "identifier", "value": "x", "position": 0},
             "value": {"tag": "number", "value": 1, "position": 0},
+            "position": 0,
         },
         "next": {
             "tag": "block",
@@ -533,6 +584,7 @@ def test_parse_block_statement():
                 "tag": "=",
                 "target": {"tag": "identifier", "value": "y", "position": 0},
                 "value": {"tag": "number", "value": 2, "position": 0},
+                "position": 0,
             },
             "next": {
                 "tag": "block",
@@ -540,9 +592,13 @@ def test_parse_block_statement():
                     "tag": "=",
                     "target": {"tag": "identifier", "value": "z", "position": 0},
                     "value": {"tag": "number", "value": 3, "position": 0},
+                    "position": 0,
                 },
+                "position": 0,
             },
+            "position": 0,
         },
+        "position": 0,
     }
     # ast = parse_block_statement(tokenize("{return 1}"))[0]
     # ast = depo(ast)
@@ -0,0 +1,408 @@
+"""
+resolver.py -- resolve identifiers to (depth, slot) addresses before running
+
+evaluate() finds a variable by walking the "$parent" chain of environment
+dictionaries on every read. The resolver does that walk once per identifier
+in the program: it turns the environment chain into a list of array-backed
+frames (depth 0 is the innermost) and annotates every identifier and "="
+node with the address of its slot.
+
+    frames = frames_from_environment(environment)
+    resolve(ast, frames)
+    value, returning = evaluate(ast, frames)
+    environment = FrameEnvironment(frames)     # dict view, e.g. for printing
+
+A name assigned anywhere in the program gets a slot in the innermost frame.
+Until the assignment has run, that slot holds `unset`, and reads of the name
+fall back to the address where it was found further out, the same answer
+the "$parent" walk would give.
+"""
+
+from collections.abc import MutableMapping
+
+from tokenizer import tokenize
+from parser import parse
+import compiler
+import evaluator
+import output
+
+unset = object()
+
+
+class Frame:
+    """
+    one environment dictionary as parallel lists of names and values
+    """
+
+    __slots__ = ["names", "values", "slots"]
+
+    def __init__(self, bindings=None):
+        self.names = []
+        self.values = []
+        self.slots = {}
+        for identifier, value in (bindings or {}).items():
+            self.add(identifier, value)
+
+    def add(self, identifier, value=unset):
+        if identifier not in self.slots:
+            self.slots[identifier] = len(self.names)
+            self.names.append(identifier)
+            self.values.append(value)
+        return self.slots[identifier]
+
+
+def frames_from_environment(environment):
+    """
+    [innermost frame, its parent, ...] for a chain of "$parent" dictionaries
+    """
+    frames = []
+    while environment:
+        frames.append(
+            Frame({k: v for k, v in environment.items() if k != "$parent"})
+        )
+        environment = environment.get("$parent", None)
+    if not frames:
+        frames.append(Frame())
+    return frames
+
+
+def find(frames, identifier, depth=0):
+    """
+    address of the first frame at or beyond depth that binds identifier
+    """
+    for depth in range(depth, len(frames)):
+        if identifier in frames[depth].slots:
+            return depth, frames[depth].slots[identifier]
+    return None
+
+
+child_keys = ["condition", "then", "else", "do", "statement", "statements",
+              "arguments", "target", "value", "left", "right", "next"]
+
+
+def children(node):
+    """
+    the child nodes of node, last one first, so that popping them off a
+    stack visits the program in source order
+    """
+    found = []
+    for key in reversed(child_keys):
+        value = node.get(key, None)
+        if type(value) is dict:
+            found.append(value)
+        elif type(value) is list:
+            found.extend(reversed(value))
+    return found
+
+
+def assigned_names(ast):
+    """
+    every identifier that is the target of an "=" in the program
+    """
+    names = []
+    pending = [ast]
+    while pending:
+        node = pending.pop()
+        if node["tag"] == "=":
+            names.append(node["target"]["value"])
+        pending.extend(children(node))
+    return names
+
+
+def resolve(ast, frames):
+    """
+    annotate identifier nodes with "address" (and "fallback" for names that
+    start out unset) and "=" nodes with the "address" they store to
+    """
+    # a slot added by an earlier resolve() may still be unset
+    frame = frames[0]
+    initially_bound = {
+        identifier for identifier, slot in frame.slots.items() if frame.values[slot] is not unset
+    }
+    for identifier in assigned_names(ast):
+        frames[0].add(identifier)
+    pending = [ast]
+    while pending:
+        node = pending.pop()
+        if node["tag"] == "identifier":
+            node["address"] = find(frames, node["value"])
+            node.pop("fallback", None)
+            if node["address"] is not None and node["address"][0] == 0:
+                if node["value"] not in initially_bound:
+                    node["fallback"] = find(frames, node["value"], 1)
+        if node["tag"] == "=":
+            assert (
+                node["target"]["tag"] == "identifier"
+            ), f"ERROR: Expecting identifier in assignment statement."
+            node["address"] = frames[0].slots[node["target"]["value"]]
+        pending.extend(children(node))
+    return ast
+
+
+def evaluate(ast, frames):
+    try:
+        handler = handlers[ast["tag"]]
+    except KeyError:
+        raise Exception(f"Unknown token in AST: {ast['tag']}")
+    return handler(ast, frames)
+
+
+def evaluate_identifier(ast, frames):
+    address = ast["address"]
+    if address is None:
+        return None, False
+    value = frames[address[0]].values[address[1]]
+    if value is unset:
+        address = ast["fallback"]
+        if address is None:
+            return None, False
+        value = frames[address[0]].values[address[1]]
+    return value, False
+
+
+def evaluate_assignment(ast, frames):
+    value, _ = evaluate(ast["value"], frames)
+    frames[0].values[ast["address"]] = value
+    return None, False
+
+
+def evaluate_number(ast, frames):
+    return ast["value"], False
+
+
+def evaluate_if(ast, frames):
+    condition, _ = evaluate(ast["condition"], frames)
+    if condition:
+        value, _ = evaluate(ast["then"], frames)
+        return value, False
+    if ast.get("else", None):
+        value, _ = evaluate(ast["else"], frames)
+        return value, False
+    return None, False
+
+
+def evaluate_while(ast, frames):
+    condition, _ = evaluate(ast["condition"], frames)
+    while condition:
+        evaluate(ast["do"], frames)
+        condition, _ = evaluate(ast["condition"], frames)
+    return None, False
+
+
+def evaluate_print(ast, frames):
+    argument = ast.get("arguments", None)
+    if type(argument) is list:
+        for argument in argument:
+            value, _ = evaluate(argument, frames)
+            output.write(str(value) + " ")
+        argument = None
+    while argument:
+        value, _ = evaluate(argument, frames)
+        output.write(str(value) + " ")
+        argument = argument.get("next", None)
+    output.write("\n")
+    return None, False
+
+
+def evaluate_block(ast, frames):
+    if "statements" in ast:
+        value, returning = None, False
+        for statement in ast["statements"]:
+            value, returning = evaluate(statement, frames)
+            if returning:
+                break
+        return value, returning
+    value, returning = evaluate(ast["statement"], frames)
+    if ast.get("next") and not returning:
+        value, returning = evaluate(ast["next"], frames)
+    return value, returning
+
+
+def evaluate_not(ast, frames):
+    value, _ = evaluate(ast["value"], frames)
+    if value:
+        return 0, False
+    return 1, False
+
+
+def evaluate_negate(ast, frames):
+    value, _ = evaluate(ast["value"], frames)
+    return -value, False
+
+
+def binary(operation):
+    def evaluate_binary(ast, frames):
+        left_value, _ = evaluate(ast["left"], frames)
+        right_value, _ = evaluate(ast["right"], frames)
+        return operation(left_value, right_value), False
+
+    return evaluate_binary
+
+
+handlers = {
+    "number": evaluate_number,
+    "identifier": evaluate_identifier,
+    "if": evaluate_if,
+    "while": evaluate_while,
+    "print": evaluate_print,
+    "block": evaluate_block,
+    "not": evaluate_not,
+    "negate": evaluate_negate,
+    "=": evaluate_assignment,
+}
+for tag, operation in compiler.binary_operators.items():
+    handlers[tag] = binary(operation)
+
+
+def evaluate_and(ast, frames):
+    left_value, _ = evaluate(ast["left"], frames)
+    if not left_value:
+        return int(left_value), False
+    right_value, _ = evaluate(ast["right"], frames)
+    return int(right_value), False
+
+
+def evaluate_or(ast, frames):
+    left_value, _ = evaluate(ast["left"], frames)
+    if left_value:
+        return int(left_value), False
+    right_value, _ = evaluate(ast["right"], frames)
+    return int(right_value), False
+
+
+handlers["&&"] = evaluate_and
+handlers["||"] = evaluate_or
+
+
+class FrameEnvironment(MutableMapping):
+    """
+    the innermost frame seen as an environment dictionary, with "$parent"
+    giving the next frame out; slots that are still unset are left out
+    """
+
+    def __init__(self, frames, depth=0):
+        self.frames = frames
+        self.depth = depth
+
+    def frame(self):
+        return self.frames[self.depth]
+
+    def parent(self):
+        if self.depth + 1 < len(self.frames):
+            return FrameEnvironment(self.frames, self.depth + 1)
+        return None
+
+    def __getitem__(self, identifier):
+        if identifier == "$parent" and self.parent() is not None:
+            return self.parent()
+        frame = self.frame()
+        if identifier in frame.slots:
+            value = frame.values[frame.slots[identifier]]
+            if value is not unset:
+                return value
+        raise KeyError(identifier)
+
+    def __setitem__(self, identifier, value):
+        frame = self.frame()
+        frame.values[frame.add(identifier)] = value
+
+    def __delitem__(self, identifier):
+        frame = self.frame()
+        if identifier not in frame.slots or frame.values[frame.slots[identifier]] is unset:
+            raise KeyError(identifier)
+        frame.values[frame.slots[identifier]] = unset
+
+    def __iter__(self):
+        frame = self.frame()
+        for identifier, value in zip(frame.names, frame.values):
+            if value is not unset:
+                yield identifier
+        if self.parent() is not None:
+            yield "$parent"
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        """
+        the equivalent chain of plain "$parent" dictionaries
+        """
+        return {
+            identifier: value.to_dict() if identifier == "$parent" else value
+            for identifier, value in self.items()
+        }
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+def run(ast, environment):
+    """
+    resolve and evaluate ast against a dictionary environment, then store
+    the innermost frame back into it, as evaluator.evaluate would have
+    """
+    frames = frames_from_environment(environment)
+    resolve(ast, frames)
+    value, returning = evaluate(ast, frames)
+    for identifier, value_ in FrameEnvironment(frames).items():
+        if identifier != "$parent":
+            environment[identifier] = value_
+    return value, returning
+
+
+def test_resolve_addresses():
+    print("test resolve addresses")
+    frames = frames_from_environment({"x": 1, "$parent": {"y": 2, "x": 3}})
+    ast = resolve(parse(tokenize("{z = x + y; y = z}")), frames)
+    assignment = ast["statement"]
+    assert assignment["address"] == 1
+    assert assignment["value"]["left"]["address"] == (0, 0)
+    assert "fallback" not in assignment["value"]["left"]
+    assert assignment["value"]["right"]["address"] == (0, 2)
+    assert assignment["value"]["right"]["fallback"] == (1, 0)
+    assert frames[0].names == ["x", "z", "y"]
+
+
+def test_unset_falls_back_to_parent():
+    print("test unset falls back to parent")
+    environment = {"q": 0, "$parent": {"x": 4}}
+    assert run(parse(tokenize("{y = x; x = 1; z = x}")), environment) == (None, False)
+    assert environment == {"q": 0, "y": 4, "x": 1, "z": 1, "$parent": {"x": 4}}
+    assert run(parse(tokenize("w")), {}) == (None, False)
+
+
+def test_frames_reused():
+    print("test frames reused")
+    frames = frames_from_environment({"$parent": {"y": 5}})
+    evaluate(resolve(parse(tokenize("if (0) y = 1")), frames), frames)
+    ast = resolve(parse(tokenize("{x = y; y = 2; z = y}")), frames)
+    evaluate(ast, frames)
+    assert FrameEnvironment(frames).to_dict() == {"y": 2, "x": 5, "z": 2, "$parent": {"y": 5}}
+
+
+def test_frame_environment():
+    print("test frame environment")
+    environment = {"x": 1, "$parent": {"y": 2}}
+    frames = frames_from_environment(environment)
+    resolve(parse(tokenize("{z = x + y}")), frames)
+    view = FrameEnvironment(frames)
+    assert view.to_dict() == environment
+    assert "z" not in view
+    view["z"] = 5
+    assert view["z"] == 5
+    assert view["$parent"]["y"] == 2
+    assert repr(view) == repr({"x": 1, "z": 5, "$parent": {"y": 2}})
+
+
+def test_same_as_evaluator():
+    print("test same as evaluator")
+    evaluator.assert_same_as_evaluator(run)
+
+
+if __name__ == "__main__":
+    test_resolve_addresses()
+    test_unset_falls_back_to_parent()
+    test_frames_reused()
+    test_frame_environment()
+    test_same_as_evaluator()
+    print("done.")
@@ -0,0 +1,241 @@
+"""
+sampler.py -- find where a running program spends its time, by source position
+
+    sampler = Sampler(source)
+    with sampler:                          # samples the thread that enters
+        evaluate(parse(tokenize(source)), environment)
+    print(format_hits(sampler))
+    with open("program.folded", "w") as file:
+        file.write(format_collapsed(sampler))
+
+A thread wakes every interval seconds and looks at the Python stack of the
+sampled thread. Every evaluate() frame holds the node it is evaluating in
+its local variable ast, and every node carries the position of its token,
+so the evaluate() frames on the stack give the path from the program down
+to the node running at that moment. The samples are counted by that path,
+with each node named by its tag, line and column:
+
+    block 1:1;while 2:3;block 2:17;= 3:7;+ 3:13 41
+
+which is the collapsed stack format read by flamegraph.pl and speedscope.
+Only the tree walking evaluators keep nodes in frames: evaluator,
+dispatch_evaluator, resolver and stack_evaluator. stack_evaluator runs in a
+single frame whose ast is the node it last started or the if or while it
+last stepped, so its samples are one node deep, and work such as applying
+an operator or storing a value is counted against whatever node that was.
+A thread only runs when it gets the interpreter lock, so samples are at
+most sys.getswitchinterval() apart however small the interval.
+"""
+
+from bisect import bisect_right
+import sys
+import threading
+import time
+
+from tokenizer import tokenize
+from parser import parse
+import evaluator
+import output
+
+
+def line_starts(source):
+    """
+    the position of the first character of every line of source
+    """
+    starts = [0]
+    index = source.find("\n")
+    while index != -1:
+        starts.append(index + 1)
+        index = source.find("\n", index + 1)
+    return starts
+
+
+def line_column(starts, position):
+    """
+    (line, column), both counted from 1, of position
+    """
+    line = bisect_right(starts, position)
+    return line, position - starts[line - 1] + 1
+
+
+def is_evaluate(code):
+    """
+    whether frames running code are evaluating the node in their ast argument
+    """
+    return (
+        code.co_name.startswith("evaluate")
+        and code.co_argcount > 0
+        and code.co_varnames[0] == "ast"
+    )
+
+
+def node_stack(frame):
+    """
+    the nodes being evaluated by frame and the frames that called it,
+    outermost first
+    """
+    nodes = []
+    while frame is not None:
+        if is_evaluate(frame.f_code):
+            ast = frame.f_locals.get("ast")
+            # a wrapper (instrument.py) holds the same node as the frame it calls
+            if type(ast) is dict and "position" in ast and not (nodes and nodes[-1] is ast):
+                nodes.append(ast)
+        frame = frame.f_back
+    nodes.reverse()
+    # the later statements of a block are reached through its chain of
+    # "next" cells, a frame each; the cells are not in the source, so the
+    # statements are shown inside the block itself
+    return [
+        node
+        for index, node in enumerate(nodes)
+        if not (index and nodes[index - 1].get("next") is node)
+    ]
+
+
+class Sampler:
+    def __init__(self, source, interval=0.001):
+        self.starts = line_starts(source)
+        self.interval = interval
+        self.stacks = {}  # ((tag, line, column), ...) outermost first -> samples
+        self.samples = 0  # including those taken outside any evaluate()
+        self.thread_id = None
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def start(self):
+        """
+        sample the calling thread until stop()
+        """
+        self.thread_id = threading.get_ident()
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exception):
+        self.stop()
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.sample(frame)
+
+    def sample(self, frame):
+        self.samples = self.samples + 1
+        nodes = node_stack(frame)
+        if not nodes:
+            return
+        stack = tuple(
+            (node["tag"],) + line_column(self.starts, node["position"]) for node in nodes
+        )
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+
+def label(entry):
+    tag, line, column = entry
+    return f"{tag} {line}:{column}"
+
+
+def format_collapsed(sampler):
+    """
+    one line per sampled stack, "outermost;...;innermost count"
+    """
+    return "".join(
+        ";".join(label(entry) for entry in stack) + f" {count}\n"
+        for stack, count in sorted(sampler.stacks.items())
+    )
+
+
+def hits(sampler):
+    """
+    {(line, column, tag): samples} for the innermost node of each sample
+    """
+    found = {}
+    for stack, count in sampler.stacks.items():
+        tag, line, column = stack[-1]
+        found[(line, column, tag)] = found.get((line, column, tag), 0) + count
+    return found
+
+
+def format_hits(sampler, limit=20):
+    """
+    the positions sampled most often, one per line
+    """
+    total = sum(sampler.stacks.values())
+    lines = [f"{sampler.samples} samples, {total} in evaluate"]
+    ranked = sorted(hits(sampler).items(), key=lambda item: -item[1])
+    for (line, column, tag), count in ranked[:limit]:
+        lines.append(f"{line:>6}:{column:<4} {tag:<12} {count:>8} {count / total:6.1%}")
+    return "\n".join(lines)
+
+
+def test_line_column():
+    print("test line column")
+    starts = line_starts("ab\n\ncd\n")
+    assert starts == [0, 3, 4, 7]
+    assert [line_column(starts, position) for position in range(7)] == [
+        (1, 1), (1, 2), (1, 3), (2, 1), (3, 1), (3, 2), (3, 3)
+    ]
+
+
+def test_node_stack():
+    print("test node stack")
+    source = "{x = 1;\n if (x) {\n  y = 2; print(x + y)\n }\n}"
+    ast = parse(tokenize(source))
+    sampler = Sampler(source)
+    original = evaluator.evaluate
+
+    def evaluate(ast, environment):
+        if ast["tag"] == "+":
+            sampler.sample(sys._getframe())
+        return original(ast, environment)
+
+    evaluator.evaluate = evaluate
+    try:
+        with output.redirect(output.ListSink()):
+            evaluator.evaluate(ast, {})
+    finally:
+        evaluator.evaluate = original
+    assert sampler.samples == 1
+    assert format_collapsed(sampler) == (
+        "block 1:1;if 2:2;block 2:9;print 3:10;+ 3:18 1\n"
+    )
+    assert hits(sampler) == {(3, 18, "+"): 1}
+
+
+def test_sampling():
+    print("test sampling")
+    source = "{i = 0;\n while (i < 100000) {\n  i = i + 1\n }\n}"
+    ast = parse(tokenize(source))
+    sampler = Sampler(source)
+    with sampler:
+        start = time.perf_counter()
+        # run for long enough to be sampled, however fast this machine is
+        while time.perf_counter() - start < 0.2:
+            evaluator.evaluate(ast, {})
+    assert sum(sampler.stacks.values()) > 0
+    for stack in sampler.stacks:
+        assert stack[0] == ("block", 1, 1), stack
+    assert any(("while", 2, 2) in stack for stack in sampler.stacks)
+    for line in format_collapsed(sampler).splitlines():
+        frames, count = line.rsplit(" ", 1)
+        assert frames.startswith("block 1:1") and int(count) > 0
+    assert format_hits(sampler).splitlines()[0].endswith(" in evaluate")
+
+
+if __name__ == "__main__":
+    test_line_column()
+    test_node_stack()
+    test_sampling()
+    print("done.")
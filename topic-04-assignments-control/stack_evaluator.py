@@ -0,0 +1,247 @@
+"""
+stack_evaluator.py -- evaluator.evaluate driven by an explicit work stack
+
+evaluate() in evaluator.py recurses for every subexpression and every link
+of a block, so long blocks and deeply nested expressions raise
+RecursionError. Here the work still to do is a list of instructions and
+intermediate values live on a second list, so the depth of the Python stack
+does not depend on the program. Values, printed output and exceptions are
+those of evaluator.evaluate, for ASTs in the linked or the list form.
+
+    value, returning = evaluate(ast, environment)
+
+Instructions are tuples whose first item says what to do:
+
+    (EVALUATE, node)      evaluate node, pushing its value
+    (APPLY, operation)    pop right and left, push operation(left, right)
+    (AND, node)           pop the left value of "&&"; decide or evaluate the right
+    (OR, node)            the same for "||"
+    (TO_INT,)             replace the top value by int(value)
+    (NOT,) (NEGATE,)      replace the top value
+    (STORE, identifier)   pop a value into the environment, push None
+    (IF, node)            pop a condition and evaluate a branch, or push None
+    (WHILE, node)         pop a condition, run the body and test again, or push None
+    (POP,)                drop the top value
+    (PRINT_VALUE,)        pop a value and print it
+    (PRINT_END,)          end the printed line and push None
+"""
+
+import sys
+
+from tokenizer import tokenize_single_pass
+import compiler
+import cursor_parser
+import evaluator
+import list_form
+import output
+import stack_parser
+
+EVALUATE = 0
+APPLY = 1
+AND = 2
+OR = 3
+TO_INT = 4
+NOT = 5
+NEGATE = 6
+STORE = 7
+IF = 8
+WHILE = 9
+POP = 10
+PRINT_VALUE = 11
+PRINT_END = 12
+
+
+def evaluate(ast, environment):
+    work = [(EVALUATE, ast)]
+    values = []
+    push = values.append
+    pop = values.pop
+    schedule = work.append
+    binary_operators = compiler.binary_operators
+    while work:
+        instruction = work.pop()
+        kind = instruction[0]
+        if kind == EVALUATE:
+            ast = instruction[1]
+            tag = ast["tag"]
+            if tag == "number":
+                assert type(ast["value"]) in [
+                    float,
+                    int,
+                ], f"unexpected ast numeric value {ast['value']} is a {type(ast['value'])}."
+                push(ast["value"])
+            elif tag == "identifier":
+                assert (
+                    type(ast["value"]) is str
+                ), f"unexpected ast identifier value {ast['value']} is a {type(ast['value'])}."
+                scope = environment
+                while scope:
+                    if ast["value"] in scope:
+                        push(scope.get(ast["value"]))
+                        break
+                    scope = scope.get("$parent", None)
+                else:
+                    push(None)
+            elif tag == "&&":
+                schedule((AND, ast))
+                schedule((EVALUATE, ast["left"]))
+            elif tag == "||":
+                schedule((OR, ast))
+                schedule((EVALUATE, ast["left"]))
+            elif tag in binary_operators:
+                schedule((APPLY, binary_operators[tag]))
+                schedule((EVALUATE, ast["right"]))
+                schedule((EVALUATE, ast["left"]))
+            elif tag == "negate":
+                schedule((NEGATE,))
+                schedule((EVALUATE, ast["value"]))
+            elif tag == "not":
+                schedule((NOT,))
+                schedule((EVALUATE, ast["value"]))
+            elif tag == "=":
+                assert (
+                    ast["target"]["tag"] == "identifier"
+                ), f"ERROR: Expecting identifier in assignment statement."
+                assert ast["value"], f"ERROR: Expecting expression in assignment statement."
+                schedule((STORE, ast["target"]["value"]))
+                schedule((EVALUATE, ast["value"]))
+            elif tag == "if":
+                schedule((IF, ast))
+                schedule((EVALUATE, ast["condition"]))
+            elif tag == "while":
+                schedule((WHILE, ast))
+                schedule((EVALUATE, ast["condition"]))
+            elif tag == "block":
+                if "statements" in ast:
+                    statements = ast["statements"]
+                    if not statements:
+                        push(None)
+                    for index in range(len(statements) - 1, -1, -1):
+                        schedule((EVALUATE, statements[index]))
+                        if index > 0:
+                            schedule((POP,))
+                else:
+                    # the value of a block is the value of its last statement
+                    if ast.get("next"):
+                        schedule((EVALUATE, ast["next"]))
+                        schedule((POP,))
+                    schedule((EVALUATE, ast["statement"]))
+            elif tag == "print":
+                schedule((PRINT_END,))
+                arguments = ast.get("arguments", None)
+                if type(arguments) is not list:
+                    argument, arguments = arguments, []
+                    while argument:
+                        arguments.append(argument)
+                        argument = argument.get("next", None)
+                # each value is printed as soon as it is known, as evaluate does
+                for argument in reversed(arguments):
+                    schedule((PRINT_VALUE,))
+                    schedule((EVALUATE, argument))
+            else:
+                raise Exception(f"Unknown token in AST: {tag}")
+        elif kind == APPLY:
+            right = pop()
+            values[-1] = instruction[1](values[-1], right)
+        elif kind == AND:
+            if values[-1]:
+                pop()
+                schedule((TO_INT,))
+                schedule((EVALUATE, instruction[1]["right"]))
+            else:
+                values[-1] = int(values[-1])
+        elif kind == OR:
+            if values[-1]:
+                values[-1] = int(values[-1])
+            else:
+                pop()
+                schedule((TO_INT,))
+                schedule((EVALUATE, instruction[1]["right"]))
+        elif kind == TO_INT:
+            values[-1] = int(values[-1])
+        elif kind == NOT:
+            values[-1] = 0 if values[-1] else 1
+        elif kind == NEGATE:
+            values[-1] = -values[-1]
+        elif kind == STORE:
+            environment[instruction[1]] = pop()
+            push(None)
+        elif kind == IF:
+            ast = instruction[1]
+            if pop():
+                schedule((EVALUATE, ast["then"]))
+            elif ast.get("else", None):
+                schedule((EVALUATE, ast["else"]))
+            else:
+                push(None)
+        elif kind == WHILE:
+            ast = instruction[1]
+            if pop():
+                schedule(instruction)
+                schedule((EVALUATE, ast["condition"]))
+                schedule((POP,))
+                schedule((EVALUATE, ast["do"]))
+            else:
+                push(None)
+        elif kind == POP:
+            pop()
+        elif kind == PRINT_VALUE:
+            output.write(str(pop()) + " ")
+        elif kind == PRINT_END:
+            output.write("\n")
+            push(None)
+    return values.pop(), False
+
+
+def test_same_as_evaluator():
+    print("test same as evaluator")
+    evaluator.assert_same_as_evaluator(evaluate)
+    evaluator.assert_same_as_evaluator(
+        lambda ast, environment: evaluate(list_form.to_list_form(ast), environment)
+    )
+
+
+def test_errors():
+    print("test errors")
+    for code, environment in [("1/0", {}), ("x + 1", {}), ("print(1, 2, 3/x)", {"x": 0})]:
+        results = []
+        for evaluate_ in [evaluator.evaluate, evaluate]:
+            try:
+                evaluator.run(evaluate_, code, dict(environment))
+            except Exception as e:
+                results.append((type(e), str(e)))
+        assert len(results) == 2 and results[0] == results[1], code
+    try:
+        evaluate({"tag": "return"}, {})
+        assert False, "expected an exception for an unknown tag"
+    except Exception as e:
+        assert str(e) == "Unknown token in AST: return"
+
+
+def test_unbounded_depth():
+    print("test unbounded depth")
+    depth = 20 * sys.getrecursionlimit()
+    programs = stack_parser.nested_programs(depth)
+    for name, expected in [
+        ("parentheses", 3),
+        ("minus", 3),
+        ("not", 1),
+        ("operators", depth + 1),
+        ("blocks", None),
+    ]:
+        ast = stack_parser.parse(tokenize_single_pass(programs[name]))
+        assert evaluate(ast, {"x": 3}) == (expected, False), name
+    environment = {"x": 0}
+    ast = stack_parser.parse(tokenize_single_pass(programs["while"]))
+    assert evaluate(ast, environment) == (None, False)
+    ast = cursor_parser.parse(tokenize_single_pass(list_form.long_block(depth)))
+    environment = {}
+    assert evaluate(ast, environment) == (None, False)
+    assert environment["x9"] == depth - 1
+
+
+if __name__ == "__main__":
+    test_same_as_evaluator()
+    test_errors()
+    test_unbounded_depth()
+    print("done.")
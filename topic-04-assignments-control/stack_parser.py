@@ -0,0 +1,329 @@
+"""
+stack_parser.py -- the cursor_parser.py grammar without recursion
+
+cursor_parser recurses once per nesting level, so generated code with
+long "-" or "!" chains or deeply nested "(" or "{" runs out of Python
+stack. This parser keeps its pending work in explicit stacks instead. The
+Python stack stays the same depth however deeply the input nests. It
+builds the same ASTs as cursor_parser.parse() and rejects the same inputs.
+
+    ast = parse(tokens)
+
+Expressions are parsed by the same precedence climbing as cursor_parser,
+with a frame on the stack for every operator still waiting for its right
+operand and every "(" still waiting for its ")". Statements contain
+expressions but not the other way around, so statements use a second
+stack of frames for if, while and block statements waiting for the
+statement inside them.
+"""
+
+from tokenizer import tokenize, tokenize_single_pass
+import cursor_parser
+from cursor_parser import binding_powers, relational_power, additive_power
+from cursor_parser import wrap_unary, continuation
+
+# change whenever the AST for a token list changes; cache.py keys on it.
+# It continues the numbering of the parser.py version the cache used before
+# (2: every node has a position)
+version = 2
+
+
+def parse_expression(tokens, current):
+    """
+    expression = logical_expression [ "=" math_expression ]
+
+    frames on the stack, innermost last:
+        ["binary", left, tag, min_power, position]   waiting for the right operand
+        ["not", first, stop, min_power]              waiting for the operand of the
+                                                     "!"s in tokens[first:stop]
+        ["expression"]                               waiting for the logical_expression
+        ["assign", target, position]                 waiting for the math_expression
+        ["paren", first, stop, min_power]            waiting for a whole expression and
+                                                     ")", after the "-"s in
+                                                     tokens[first:stop]
+    """
+    stack = [["expression"]]
+    min_power = 1
+    while True:
+        # an operand, binding at least as tightly as min_power
+        if min_power <= relational_power and tokens[current]["tag"] == "!":
+            first = current
+            while tokens[current]["tag"] == "!":
+                current = current + 1
+            stack.append(["not", first, current, min_power])
+            min_power = relational_power
+        first = current
+        while tokens[current]["tag"] == "-":
+            current = current + 1
+        token = tokens[current]
+        tag = token["tag"]
+        if tag == "(":
+            stack.append(["paren", first, current, min_power])
+            stack.append(["expression"])
+            min_power = 1
+            current = current + 1
+            continue
+        if tag != "number" and tag != "identifier":
+            raise Exception(f"Error: unexpected token '{tag}' at position {token['position']}.")
+        node = {"tag": tag, "value": token["value"], "position": token["position"]}
+        node = wrap_unary("negate", tokens, first, current, node)
+        current = current + 1
+        # the operators following the operand, and the frames it completes
+        while True:
+            tag = tokens[current]["tag"]
+            power = binding_powers.get(tag, 0)
+            if power >= min_power:
+                stack.append(["binary", node, tag, min_power, tokens[current]["position"]])
+                min_power = power + 1
+                current = current + 1
+                break
+            frame = stack.pop()
+            kind = frame[0]
+            if kind == "binary":
+                node = {"tag": frame[2], "left": frame[1], "right": node, "position": frame[4]}
+                min_power = frame[3]
+            elif kind == "not":
+                node = wrap_unary("not", tokens, frame[1], frame[2], node)
+                min_power = frame[3]
+            elif kind == "expression" and tag == "=":
+                stack.append(["assign", node, tokens[current]["position"]])
+                min_power = additive_power
+                current = current + 1
+                break
+            else:
+                if kind == "assign":
+                    node = {"tag": "=", "target": frame[1], "value": node, "position": frame[2]}
+                # a whole expression: the value of a parenthesis, or the result
+                if not stack:
+                    return node, current
+                frame = stack.pop()
+                assert tokens[current]["tag"] == ")", "Error: expected ')'"
+                current = current + 1
+                node = wrap_unary("negate", tokens, frame[1], frame[2], node)
+                min_power = frame[3]
+
+
+def parse_expression_list(tokens, current):
+    """
+    expression_list = "(" [ expression { "," expression } ] ")";
+    """
+    assert tokens[current]["tag"] == "(", "Error: expected '('"
+    current = current + 1
+    first_node = None
+    if tokens[current]["tag"] != ")":
+        node, current = parse_expression(tokens, current)
+        first_node = node
+        while tokens[current]["tag"] != ")":
+            assert tokens[current]["tag"] == ",", "Error: expected ','"
+            node["next"], current = parse_expression(tokens, current + 1)
+            node = node["next"]
+    return first_node, current + 1
+
+
+def parse_statement(tokens, current):
+    """
+    statement = if_statement | while_statement | print_statement | block_statement | expression;
+
+    frames on the stack, innermost last:
+        ["then", node]                  an if statement waiting for its then statement
+        ["else", node]                  an if statement waiting for its else statement
+        ["do", node]                    a while statement waiting for its body
+        ["block", first_node, node]     a block waiting for its next statement
+    """
+    stack = []
+    while True:
+        # descend to the first statement that contains no statement
+        tag = tokens[current]["tag"]
+        position = tokens[current]["position"]
+        if tag == "if":
+            assert tokens[current + 1]["tag"] == "(", "Error: expected '('"
+            condition, current = parse_expression(tokens, current + 2)
+            assert tokens[current]["tag"] == ")", "Error: expected ')'"
+            stack.append(["then", {"tag": "if", "condition": condition, "position": position}])
+            current = current + 1
+            continue
+        if tag == "while":
+            assert tokens[current + 1]["tag"] == "(", "Error: expected '('"
+            condition, current = parse_expression(tokens, current + 2)
+            assert tokens[current]["tag"] == ")", "Error: expected ')'"
+            stack.append(["do", {"tag": "while", "condition": condition, "position": position}])
+            current = current + 1
+            continue
+        if tag == "{":
+            current = current + 1
+            node = {"tag": "block", "position": position}
+            while tokens[current]["tag"] == ";":
+                current = current + 1
+            if tokens[current]["tag"] != "}":
+                stack.append(["block", node, node])
+                continue
+            statement = node
+            current = current + 1
+        elif tag == "print":
+            arguments, current = parse_expression_list(tokens, current + 1)
+            statement = {"tag": "print", "arguments": arguments, "position": position}
+        else:
+            statement, current = parse_expression(tokens, current)
+        # hand the statement to the frames waiting for it
+        while True:
+            if not stack:
+                return statement, current
+            frame = stack[-1]
+            kind = frame[0]
+            if kind == "then":
+                node = frame[1]
+                node["then"] = statement
+                if tokens[current]["tag"] == "else":
+                    frame[0] = "else"
+                    current = current + 1
+                    break
+                stack.pop()
+                statement = node
+            elif kind == "else":
+                stack.pop()
+                frame[1]["else"] = statement
+                statement = frame[1]
+            elif kind == "do":
+                stack.pop()
+                frame[1]["do"] = statement
+                statement = frame[1]
+            else:
+                node = frame[2]
+                if "statement" not in node:
+                    node["statement"] = statement
+                else:
+                    node["next"] = continuation(statement)
+                    node = frame[2] = node["next"]
+                if tokens[current]["tag"] == ";":
+                    while tokens[current]["tag"] == ";":
+                        current = current + 1
+                    if tokens[current]["tag"] != "}":
+                        break
+                assert tokens[current]["tag"] == "}", "Error: expected ';' or '}'"
+                stack.pop()
+                statement = frame[1]
+                current = current + 1
+
+
+def parse(tokens):
+    ast, _ = parse_statement(tokens, 0)
+    return ast
+
+
+def iter_statements(tokens):
+    """
+    yield the statements of a script, one at a time, as they are parsed;
+    statements follow one another, separated by whitespace or ";", and a
+    statement may run over any number of lines
+    """
+    current = 0
+    while True:
+        while tokens[current]["tag"] == ";":
+            current = current + 1
+        if tokens[current]["tag"] == "end":
+            return
+        statement, current = parse_statement(tokens, current)
+        yield statement
+
+
+def nested_programs(depth):
+    """
+    programs nesting depth levels deep in each of the ways the grammar allows
+    """
+    return {
+        "parentheses": "(" * depth + "x" + ")" * depth,
+        "minus": "-" * depth + "x",
+        "not": "!" * depth + "x",
+        "operators": "1" + " + (1" * depth + ")" * depth,
+        "blocks": "{" * depth + "x = 1" + "}" * depth,
+        "if": "if (x) " * depth + "x = 1",
+        "while": "while (x) " * depth + "x = x - 1",
+        "mixed": "{ if (a) while (-(b)) " * depth + "print(!(x))" + "}" * depth,
+    }
+
+
+def depth(ast):
+    """
+    the number of nodes on the longest path from ast to a leaf
+    """
+    deepest = 0
+    pending = [(ast, 1)]
+    while pending:
+        node, level = pending.pop()
+        deepest = max(deepest, level)
+        for value in node.values():
+            if type(value) is dict:
+                pending.append((value, level + 1))
+    return deepest
+
+
+def test_same_ast_as_cursor_parser():
+    print("test same ast as cursor parser")
+    for code in cursor_parser.sample_programs + list(nested_programs(50).values()) + [
+        "1 - 2 - 3 * -(4 / x)",
+        "!a && !!b || !(c) && d",
+        "!x + 1 < 3",
+        "x = a < b",
+        "x = -(y = 1)",
+        "print(-(1), (2 + 3) * 4, !x)",
+        "if(a) if(b) x=1 else x=2 else x=3",
+        "{{}; {;}; {x=1;}}",
+    ]:
+        tokens = tokenize(code)
+        assert parse_statement(tokens, 0) == cursor_parser.parse_statement(tokens, 0), code
+
+
+def test_same_errors_as_cursor_parser():
+    print("test same errors as cursor parser")
+    for code in ["x < !y", "1 + !x", "(1", "* 2", "1 + ", "-!x", "{x=1 y=2}",
+                 "{x=1;", "if x", "while(1", "print(1 2)", "{x=1; 1 2}", ")"]:
+        tokens = tokenize(code)
+        errors = []
+        for parse_function in [cursor_parser.parse, parse]:
+            try:
+                parse_function(tokens)
+            except Exception as e:
+                # pytest adds the failing comparison after the message of an assert
+                errors.append((type(e), str(e).split("\n")[0]))
+            else:
+                raise Exception(f"{parse_function.__module__}.parse accepted {code!r}")
+        assert errors[0] == errors[1], (code, errors)
+
+
+def test_iter_statements():
+    print("test iter statements")
+    code = "x = 1\nif (x)\n  y = 2\nelse\n  y = 3;;\n{\n  print(x,\n    y)\n}\n"
+    statements = list(iter_statements(tokenize(code)))
+    assert [statement["tag"] for statement in statements] == ["=", "if", "block"]
+    assert statements[1]["else"]["value"] == {"tag": "number", "value": 3, "position": 32}
+    assert statements[2]["statement"]["tag"] == "print"
+    assert list(iter_statements(tokenize(" ; "))) == []
+    try:
+        list(iter_statements(tokenize("x = 1 )")))
+        assert False, "expected an exception for a stray ')'"
+    except Exception as e:
+        assert str(e) == "Error: unexpected token ')' at position 6."
+
+
+def test_deep_nesting():
+    print("test deep nesting")
+    for name, code in nested_programs(10000).items():
+        assert depth(parse(tokenize_single_pass(code))) > 10000 or name == "parentheses"
+    programs = nested_programs(100000)
+    ast = parse(tokenize_single_pass(programs["parentheses"]))
+    assert ast == {"tag": "identifier", "value": "x", "position": 100000}
+    for name in ["minus", "not", "blocks"]:
+        assert depth(parse(tokenize_single_pass(programs[name]))) > 100000, name
+    try:
+        cursor_parser.parse(tokenize_single_pass(programs["blocks"]))
+        assert False, "expected the recursive parser to run out of stack"
+    except RecursionError:
+        pass
+
+
+if __name__ == "__main__":
+    test_same_ast_as_cursor_parser()
+    test_same_errors_as_cursor_parser()
+    test_iter_statements()
+    test_deep_nesting()
+    print("done.")
@@ -6,7 +6,13 @@ break character stream into tokens, provide a list of tokens
     tokens = tokenize(string_of_code)
 """
 
+import mmap
+import os
 import re
+from sys import intern
+
+# change whenever the tokens for a source change; cache.py keys on it
+version = 1
 
 patterns = [
     ["\s+", "#whitespace"],
@@ -35,10 +41,6 @@ patterns = [
     [r"\]", "]"],
     [r",", ","],
     [r"\;", ";"],
-    ["print", "print"],
-    ["if", "if"],
-    ["else", "else"],
-    ["while", "while"],
     ["(\d*\.\d+)|(\d+\.\d*)|(\d+)", "number"],
     ["[A-Za-z_][A-Za-z0-9_]*", "identifier"],
     [r"\.", "."],
@@ -48,6 +50,17 @@ patterns = [
 for pattern in patterns:
     pattern[0] = re.compile(pattern[0])
 
+# keywords are matched by the identifier pattern and then looked up here, so
+# adding a keyword adds no regex work per token and names that merely start
+# with a keyword (printer, iffy) stay identifiers; a keyword's tag is its text
+
+keywords = frozenset(["print", "if", "else", "while"])
+
+# tokenize_bytes() looks keywords up in these copies; keywords is frozen, so
+# they stay in step with it as long as a new keyword is only added above
+byte_keywords = {keyword.encode("ascii"): keyword for keyword in keywords}
+longest_keyword = max(len(keyword) for keyword in keywords)
+
 
 def tokenize(characters):
     tokens = []
@@ -63,6 +76,8 @@ def tokenize(characters):
         if tag in ["#whitespace"]:
             position = match.end()
             continue
+        if tag == "identifier" and match.group(0) in keywords:
+            tag = match.group(0)
         # update position for next match
         token = {
             "tag": tag,
@@ -86,6 +101,267 @@ def tokenize(characters):
     return tokens
 
 
+# the whole pattern table as one alternation; the regex engine tries the
+# alternatives in table order, so the first entry that matches still wins
+
+master_pattern = re.compile(
+    "|".join(
+        f"(?P<t{index}>{pattern.pattern})" for index, (pattern, _) in enumerate(patterns)
+    )
+)
+
+master_tags = {f"t{index}": tag for index, (_, tag) in enumerate(patterns)}
+
+
+def tokenize_single_pass(characters):
+    """
+    same token stream as tokenize(), but one match of master_pattern per token
+    instead of one attempt per entry of the pattern table
+
+        tokens = tokenize_single_pass(string_of_code)
+    """
+    tokens = []
+    position = 0
+    end = len(characters)
+    match_at = master_pattern.match
+    while position < end:
+        match = match_at(characters, position)
+        assert (
+            match
+        ), f"Failed to match token with [{characters}] finding {characters[15:]} at position {position}."
+        tag = master_tags[match.lastgroup]
+        if tag == "#whitespace":
+            position = match.end()
+            continue
+        value = match.group(0)
+        if tag == "number":
+            if "." in value:
+                value = float(value)
+            else:
+                value = int(value)
+        elif tag == "identifier" and value in keywords:
+            tag = value
+        tokens.append({"tag": tag, "value": value, "position": position})
+        position = match.end()
+    tokens.append({"tag": "end", "value": "", "position": position})
+    return tokens
+
+
+class TokenMethods:
+    """
+    dictionary-style access shared by the compact token classes:
+    token["tag"], token["value"] and token["position"] work, and tokens
+    compare equal to the matching token dictionaries
+    """
+
+    __slots__ = []
+
+    keys = ("tag", "value", "position")
+
+    def __getitem__(self, key):
+        if key in TokenMethods.keys:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in TokenMethods.keys:
+            return getattr(self, key)
+        return default
+
+    def as_dict(self):
+        return {"tag": self.tag, "value": self.value, "position": self.position}
+
+    def __eq__(self, other):
+        if type(other) is dict:
+            return self.as_dict() == other
+        if isinstance(other, TokenMethods):
+            return self.as_dict() == other.as_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+class Token(TokenMethods):
+    """
+    a token in about 96 bytes with its values, against 232 for a token
+    dictionary (benchmark.py token-memory); parsers that index tokens
+    (cursor_parser) consume these directly
+    """
+
+    __slots__ = ["tag", "value", "position"]
+
+    def __init__(self, tag, value, position):
+        self.tag = tag
+        self.value = value
+        self.position = position
+
+
+def tokenize_compact(characters):
+    """
+    tokenize_single_pass(), producing Token objects instead of dictionaries
+
+        tokens = tokenize_compact(string_of_code)
+    """
+    tokens = []
+    position = 0
+    end = len(characters)
+    match_at = master_pattern.match
+    while position < end:
+        match = match_at(characters, position)
+        assert (
+            match
+        ), f"Failed to match token with [{characters}] finding {characters[15:]} at position {position}."
+        tag = master_tags[match.lastgroup]
+        if tag == "#whitespace":
+            position = match.end()
+            continue
+        if tag == "identifier":
+            # repeated names share one string
+            value = intern(match.group(0))
+            if value in keywords:
+                tag = value
+        elif tag == "number":
+            value = match.group(0)
+            if "." in value:
+                value = float(value)
+            else:
+                value = int(value)
+        else:
+            # for punctuation the text is the tag itself
+            value = tag
+        tokens.append(Token(tag, value, position))
+        position = match.end()
+    tokens.append(Token("end", "", position))
+    return tokens
+
+
+# the same table for tokenizing bytes, e.g. an mmap of a source file
+
+master_bytes_pattern = re.compile(master_pattern.pattern.encode("ascii"))
+
+class ByteToken(TokenMethods):
+    """
+    a token over a bytes-like source whose value is only decoded from the
+    source when it is read; the position is a byte offset
+    """
+
+    __slots__ = ["tag", "source", "position", "length"]
+
+    def __init__(self, tag, source, position, length):
+        self.tag = tag
+        self.source = source
+        self.position = position
+        self.length = length
+
+    @property
+    def value(self):
+        if self.tag == "identifier":
+            text = self.source[self.position : self.position + self.length]
+            return text.decode("ascii")
+        if self.tag == "number":
+            text = self.source[self.position : self.position + self.length]
+            if b"." in text:
+                return float(text)
+            return int(text)
+        if self.tag == "end":
+            return ""
+        return self.tag
+
+
+def tokenize_bytes(source):
+    """
+    tokenize a bytes-like source (bytes, bytearray, mmap) into ByteTokens
+    without decoding it
+
+        tokens = tokenize_bytes(mmap_of_source)
+    """
+    tokens = []
+    position = 0
+    end = len(source)
+    match_at = master_bytes_pattern.match
+    while position < end:
+        match = match_at(source, position)
+        assert match, f"Failed to match token at byte offset {position}."
+        tag = master_tags[match.lastgroup]
+        if tag == "identifier" and match.end() - position <= longest_keyword:
+            tag = byte_keywords.get(source[position : match.end()], tag)
+        if tag != "#whitespace":
+            tokens.append(ByteToken(tag, source, position, match.end() - position))
+        position = match.end()
+    tokens.append(ByteToken("end", source, position, 0))
+    return tokens
+
+
+def tokenize_file(path):
+    """
+    tokenize_bytes() over a read-only mmap of the file at path
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return tokenize_bytes(b"")
+        source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return tokenize_bytes(source)
+
+
+def iter_tokens(source, chunk_size=65536):
+    """
+    yield the tokens of a file object, or of an iterable of string chunks,
+    reading chunk_size characters at a time; only the unconsumed tail of the
+    input is kept, so memory does not grow with the size of the input
+
+        for token in iter_tokens(open("program.txt")):
+            ...
+    """
+    if hasattr(source, "read"):
+        chunks = iter(lambda: source.read(chunk_size), "")
+    else:
+        chunks = iter(source)
+    match_at = master_pattern.match
+    buffer = ""
+    offset = 0  # position in the whole input of buffer[0]
+    position = 0  # position in buffer of the next token
+    exhausted = False
+    while True:
+        # a match that reaches the end of the buffer may grow once more
+        # input arrives
+        match = match_at(buffer, position)
+        while not exhausted and (match is None or match.end() == len(buffer)):
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+            else:
+                offset = offset + position
+                buffer = buffer[position:] + chunk
+                position = 0
+            match = match_at(buffer, position)
+        if position == len(buffer):
+            break
+        assert (
+            match
+        ), f"Failed to match token with [{buffer[position:position + 30]}...] at position {offset + position}."
+        tag = master_tags[match.lastgroup]
+        if tag != "#whitespace":
+            value = match.group(0)
+            if tag == "number":
+                if "." in value:
+                    value = float(value)
+                else:
+                    value = int(value)
+            elif tag == "identifier" and value in keywords:
+                tag = value
+            yield {"tag": tag, "value": value, "position": offset + position}
+        position = match.end()
+    yield {"tag": "end", "value": "", "position": offset + position}
+
+
+def token_dicts(tokens):
+    """
+    the dictionary form of a list of Token objects
+    """
+    return [token.as_dict() for token in tokens]
+
+
 def test_simple_tokens():
     print("test simple tokens")
     assert tokenize("") == [{"tag": "end", "value": "", "position": 0}]
@@ -105,9 +381,7 @@ def test_simple_tokens():
         {"tag": "(", "value": "(", "position": 4},
         {"tag": ")", "value": ")", "position": 5},
         {"tag": ",", "value": ",", "position": 6},
-        {"tag": "print", "value": "print", "position": 7},
-        {"tag": "if", "value": "if", "position": 12},
-        {"tag": "else", "value": "else", "position": 14},
+        {"tag": "identifier", "value": "printifelse", "position": 7},
         {"tag": "=", "value": "=", "position": 18},
         {"tag": "while", "value": "while", "position": 19},
         {"tag": "{", "value": "{", "position": 24},
@@ -163,6 +437,24 @@ def test_identifier():
     tokens = tokenize("xyz_0+++")
     assert tokens[0] == {"tag": "identifier", "value": "xyz_0", "position": 0}
 
+
+def test_keywords():
+    print("test keywords")
+    import io
+
+    tokens = tokenize("print printer iffy if else_ while1 while")
+    assert [token["tag"] for token in tokens] == [
+        "print", "identifier", "identifier", "if",
+        "identifier", "identifier", "while", "end",
+    ]
+    assert tokens[1] == {"tag": "identifier", "value": "printer", "position": 6}
+    code = "{iffy=1;if(iffy)printer=2 else whiles=3}"
+    assert tokenize_single_pass(code) == tokenize(code)
+    assert tokenize_compact(code) == tokenize(code)
+    assert tokenize_bytes(code.encode("ascii")) == tokenize(code)
+    for chunk_size in [1, 2, 3, 5]:
+        assert list(iter_tokens(io.StringIO(code), chunk_size)) == tokenize(code)
+
 def test_tokenize_expression():
     print("test tokenize expression")
     tokens = tokenize("(3.5+40)/5-(3.*.4)")
@@ -203,9 +495,103 @@ def test_tokenize_expression():
     ]
 
 
+def test_tokenize_single_pass():
+    print("test tokenize single pass")
+    for code in [
+        "",
+        "*+",
+        "*/+-(),printifelse=while{};",
+        "123 123.45 123. .25",
+        "  x xyz xyz_0+++ \t\n",
+        "(3.5+40)/5-(3.*.4)",
+        "-(-3.5+40)/5-(3.*.4)",
+        "{x=1;y=2;while(x<=10&&y!=0||!z){x=x+1}}",
+        "if(a>=b)print(a,b)else print([1],.)",
+    ]:
+        assert tokenize_single_pass(code) == tokenize(code)
+
+
+def test_tokenize_compact():
+    print("test tokenize compact")
+    code = "{x=1;y=2.5;while(x<=10&&y!=0||!z){print(x, .5)}}"
+    tokens = tokenize_compact(code)
+    assert tokens == tokenize(code)
+    assert token_dicts(tokens) == tokenize(code)
+    token = tokens[1]
+    assert token["tag"] == "identifier" and token.tag == "identifier"
+    assert token["value"] == "x" and token["position"] == 1
+    assert token.get("next") == None
+    for key in ["next", "as_dict", 0]:
+        try:
+            token[key]
+        except KeyError:
+            pass
+        else:
+            raise Exception(f"token[{key!r}] did not raise KeyError")
+    assert repr(token) == repr({"tag": "identifier", "value": "x", "position": 1})
+
+
+def test_iter_tokens():
+    print("test iter tokens")
+    import io
+
+    for code in [
+        "",
+        "   ",
+        "123.45",
+        "print(x_y_z)while{ }",
+        "{x=1;y=2.5;while(x<=10&&y!=0||!z){print(x, .5, 123.)}}",
+    ]:
+        for chunk_size in [1, 2, 3, 5, 8, 13, 100]:
+            assert list(iter_tokens(io.StringIO(code), chunk_size)) == tokenize(code)
+        chunks = [code[i : i + 2] for i in range(0, len(code), 2)]
+        assert list(iter_tokens(chunks)) == tokenize(code)
+    tokens = iter_tokens(["1 + ", "2"])
+    assert next(tokens) == {"tag": "number", "value": 1, "position": 0}
+
+
+def test_tokenize_bytes():
+    print("test tokenize bytes")
+    for code in [
+        "",
+        "123 123.45 123. .25",
+        "{x=1;y=2.5;while(x<=10&&y!=0||!z){print(x, .5)}}",
+    ]:
+        tokens = tokenize_bytes(code.encode("ascii"))
+        assert tokens == tokenize(code)
+    tokens = tokenize_bytes(b"  xyz = 4")
+    assert tokens[0].position == 2 and tokens[0].length == 3
+    assert tokens[0]["value"] == "xyz"
+    assert tokens[-1] == {"tag": "end", "value": "", "position": 9}
+
+
+def test_tokenize_file():
+    print("test tokenize file")
+    import tempfile
+
+    code = "{x=1;y=2.5;while(x<=10){print(x); x = x + 1}}"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "program.txt")
+        with open(path, "w") as file:
+            file.write(code)
+        tokens = tokenize_file(path)
+        assert type(tokens[0].source) is mmap.mmap
+        assert tokens == tokenize(code)
+        del tokens
+        with open(path, "w") as file:
+            pass
+        assert tokenize_file(path) == tokenize("")
+
+
 if __name__ == "__main__":
     test_simple_tokens()
     test_whitespace()
     test_identifier()
+    test_keywords()
     test_tokenize_expression()
+    test_tokenize_single_pass()
+    test_tokenize_compact()
+    test_iter_tokens()
+    test_tokenize_bytes()
+    test_tokenize_file()
     print("done.")
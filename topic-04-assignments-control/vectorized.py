@@ -0,0 +1,198 @@
+"""
+vectorized.py -- evaluate one expression over many environments with numpy
+
+Evaluating x*y+z/2 for a million bindings of x, y and z with evaluate() is
+a million walks of the same tree. Here the tree is walked once, and each
+node is a numpy operation over every binding at once. The environment is
+given by columns: the values of each identifier for every row, as 1-d
+arrays of the same length, or as a single number shared by every row.
+
+    columns = {"x": numpy.array([1, 2, 3]), "y": numpy.array([4, 5, 6]), "z": 2}
+    values = evaluate(parse(tokenize("x*y+z/2")), columns)
+
+values[i] is evaluate(ast, {"x": x[i], "y": y[i], "z": 2})[0]. That holds
+within numpy's fixed width types: int64 arithmetic wraps where Python ints
+would grow. Like evaluate(), "&&" and "||" only evaluate their right
+operand for the rows whose left operand does not decide the value, and a
+division by zero in any of those rows raises ZeroDivisionError. Only
+expressions can be evaluated; statements have no value per row.
+"""
+
+import numpy
+
+from tokenizer import tokenize
+from parser import parse
+import evaluator
+
+relational_operators = {
+    "<": numpy.less,
+    ">": numpy.greater,
+    "<=": numpy.less_equal,
+    ">=": numpy.greater_equal,
+    "==": numpy.equal,
+    "!=": numpy.not_equal,
+}
+
+arithmetic_operators = {
+    "+": numpy.add,
+    "-": numpy.subtract,
+    "*": numpy.multiply,
+}
+
+
+def evaluate(ast, columns):
+    """
+    an array of the values of the expression ast for every row of columns
+    """
+    columns = {name: numpy.asarray(values) for name, values in columns.items()}
+    shape = numpy.broadcast_shapes(*[values.shape for values in columns.values()])
+    assert len(shape) <= 1, f"columns must be 1-d arrays or numbers, not of shape {shape}."
+    return numpy.broadcast_to(evaluate_expression(ast, columns), shape).copy()
+
+
+def evaluate_expression(ast, columns):
+    """
+    the value of ast for every row, or a single value when it is the same
+    for every row; expressions nest no deeper than the source they were
+    parsed from, so this recurses
+    """
+    tag = ast["tag"]
+    if tag == "number":
+        assert type(ast["value"]) in [
+            float,
+            int,
+        ], f"unexpected ast numeric value {ast['value']} is a {type(ast['value'])}."
+        return ast["value"]
+    if tag == "identifier":
+        if ast["value"] not in columns:
+            raise Exception(f"No column for identifier '{ast['value']}'")
+        return columns[ast["value"]]
+    if tag in arithmetic_operators:
+        left = evaluate_expression(ast["left"], columns)
+        right = evaluate_expression(ast["right"], columns)
+        return arithmetic_operators[tag](left, right)
+    if tag == "/":
+        left = evaluate_expression(ast["left"], columns)
+        right = evaluate_expression(ast["right"], columns)
+        # numpy would give inf or nan, evaluate() raises
+        if numpy.any(numpy.equal(right, 0)):
+            raise ZeroDivisionError("division by zero")
+        return numpy.true_divide(left, right)
+    if tag in relational_operators:
+        left = evaluate_expression(ast["left"], columns)
+        right = evaluate_expression(ast["right"], columns)
+        return relational_operators[tag](left, right).astype(numpy.int64)
+    if tag == "&&" or tag == "||":
+        return evaluate_logical(ast, columns)
+    if tag == "negate":
+        return numpy.negative(evaluate_expression(ast["value"], columns))
+    if tag == "not":
+        return numpy.equal(evaluate_expression(ast["value"], columns), 0).astype(numpy.int64)
+    raise Exception(f"Cannot evaluate '{tag}' over columns")
+
+
+def evaluate_logical(ast, columns):
+    """
+    "&&" is int(left) where left is 0 and int(right) elsewhere; "||" is
+    int(left) where left is not 0 and int(right) elsewhere
+    """
+    left = numpy.asarray(evaluate_expression(ast["left"], columns))
+    if ast["tag"] == "&&":
+        pending = numpy.not_equal(left, 0)
+    else:
+        pending = numpy.equal(left, 0)
+    # astype truncates toward zero, as int() does
+    result = left.astype(numpy.int64)
+    if not numpy.any(pending):
+        return result
+    if pending.ndim == 0:
+        return numpy.asarray(evaluate_expression(ast["right"], columns)).astype(numpy.int64)
+    # the right operand, for the pending rows only
+    selected = {
+        name: values[pending] if values.ndim else values for name, values in columns.items()
+    }
+    right = numpy.asarray(evaluate_expression(ast["right"], selected)).astype(numpy.int64)
+    result = numpy.broadcast_to(result, pending.shape).copy()
+    result[pending] = right
+    return result
+
+
+def test_same_as_evaluator():
+    print("test same as evaluator")
+    generator = numpy.random.default_rng(1)
+    columns = {
+        "x": generator.integers(-5, 6, 200),
+        "y": generator.integers(1, 6, 200),
+        "z": generator.uniform(-3, 3, 200),
+        "w": 2,
+    }
+    for code in [
+        "x*y+z/2",
+        "1+3*4-10/4",
+        "-x - -y * --z",
+        "x / y",
+        "(x + w) * (y - 1) - x * x",
+        "x < y",
+        "x <= 0 != z > 0",
+        "!x",
+        "!(x - 1) || z",
+        "x && z",
+        "x > 0 && y < 3 || z >= 1",
+        "x && y / x",
+        "!x || w / x",
+        "w && z",
+        "0 || x",
+        "w",
+    ]:
+        ast = parse(tokenize(code))
+        values = evaluate(ast, columns).tolist()
+        assert len(values) == 200, code
+        for row, value in enumerate(values):
+            environment = {
+                name: column if type(column) is int else column[row].item()
+                for name, column in columns.items()
+            }
+            expected, _ = evaluator.evaluate(ast, environment)
+            assert (type(value), value) == (type(expected), expected), (code, row)
+
+
+def test_division_by_zero():
+    print("test division by zero")
+    for code, columns in [
+        ("x / y", {"x": numpy.array([1, 2]), "y": numpy.array([1, 0])}),
+        ("x / (y * 2 - 3)", {"x": numpy.array([1.0]), "y": 1.5}),
+        ("x || 1 / x", {"x": numpy.array([1, 0])}),
+    ]:
+        try:
+            evaluate(parse(tokenize(code)), columns)
+            assert False, f"expected ZeroDivisionError for {code}"
+        except ZeroDivisionError:
+            pass
+
+
+def test_errors():
+    print("test errors")
+    for code, message in [
+        ("x + q", "No column for identifier 'q'"),
+        ("x = 1", "Cannot evaluate '=' over columns"),
+        ("print(x)", "Cannot evaluate 'print' over columns"),
+    ]:
+        try:
+            evaluate(parse(tokenize(code)), {"x": numpy.arange(3)})
+            assert False, f"expected an exception for {code}"
+        except Exception as e:
+            assert str(e) == message, code
+
+
+def test_constant_expressions():
+    print("test constant expressions")
+    assert evaluate(parse(tokenize("1 + 2")), {"x": numpy.arange(3)}).tolist() == [3, 3, 3]
+    assert evaluate(parse(tokenize("1 + 2")), {}).tolist() == 3
+
+
+if __name__ == "__main__":
+    test_same_as_evaluator()
+    test_division_by_zero()
+    test_errors()
+    test_constant_expressions()
+    print("done.")